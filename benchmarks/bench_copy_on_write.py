@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016,2017 Massimiliano Culpo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Throughput of calls dispatched by reader threads while a writer thread modifies
+the composite, comparing a copy-on-write composite with a plain composite guarded
+by a global lock.
+
+Run from the root of the repository with::
+
+    PYTHONPATH=. python benchmarks/bench_copy_on_write.py [duration]
+"""
+from __future__ import print_function
+
+import sys
+import threading
+import time
+import timeit
+
+from dpp import composite
+
+
+class Item(object):
+    def get(self):
+        return 1
+
+
+@composite(method_list=['get'], copy_on_write=True)
+class CopyOnWrite(object):
+    pass
+
+
+@composite(method_list=['get'])
+class Plain(object):
+    pass
+
+
+class _NoLock(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+def run(cls, readers, lock=None, duration=1.0, items=100):
+    """Returns the number of calls per second done by the readers
+
+    :param cls: composite class
+    :param readers: number of reader threads
+    :param lock: lock guarding every call and modification (optional)
+    :param duration: time in seconds before the threads are asked to stop
+    :param items: number of items in the composite
+    """
+    composite_object = cls()
+    composite_object.extend(Item() for _ in range(items))
+    lock = lock if lock is not None else _NoLock()
+    stop = threading.Event()
+    counts = [0] * readers
+
+    def reader(idx):
+        calls = 0
+        while not stop.is_set():
+            with lock:
+                composite_object.get()
+            calls += 1
+        counts[idx] = calls
+
+    def writer():
+        while not stop.is_set():
+            with lock:
+                composite_object.append(Item())
+                del composite_object[0]
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=reader, args=(idx, )) for idx in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    # Readers stop only once the main thread gets to set the event, so the rate is
+    # computed over the time they actually ran
+    start = timeit.default_timer()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (timeit.default_timer() - start)
+
+
+def main(duration=1.0):
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print('Python {0}, GIL enabled: {1}'.format(sys.version.split()[0], gil))
+    for readers in (1, 2, 4, 8):
+        print('{0} readers: copy_on_write {1:.0f} calls/s, global lock {2:.0f} calls/s'.format(
+            readers, run(CopyOnWrite, readers, duration=duration),
+            run(Plain, readers, threading.Lock(), duration=duration)))
+
+
+if __name__ == '__main__':
+    main(*[float(x) for x in sys.argv[1:2]])
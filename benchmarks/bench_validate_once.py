@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016,2017 Massimiliano Culpo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Read latency of Expected attributes validated on every read, the default, compared
+with attributes in validate_once mode. The predicate checks a dictionary against a
+schema of 20 keys.
+
+Run from the root of the repository with::
+
+    PYTHONPATH=. python benchmarks/bench_validate_once.py [reads]
+"""
+from __future__ import print_function
+
+import functools
+import sys
+import timeit
+
+from dpp import expected
+
+SCHEMA = dict(('key{0}'.format(idx), int) for idx in range(20))
+
+
+def matches_schema(value):
+    return all(isinstance(value.get(key), kind) for key, kind in SCHEMA.items())
+
+
+class Config(object):
+    default = expected.Expected(predicate=matches_schema)
+    cached = expected.Expected(predicate=matches_schema, validate_once=True)
+
+    def __init__(self):
+        value = dict((key, 1) for key in SCHEMA)
+        self.default = value
+        self.cached = value
+
+
+def read_latency(name, reads, repeat=5):
+    """Returns the best time per read in microseconds
+
+    :param name: name of the attribute to be read
+    :param reads: number of reads per measurement
+    :param repeat: number of measurements
+    """
+    timer = timeit.Timer(functools.partial(getattr, Config(), name))
+    return min(timer.repeat(repeat=repeat, number=reads)) / reads * 1e6
+
+
+def main(reads=100000):
+    print('Python {0}, best of 5 x {1} reads'.format(sys.version.split()[0], reads))
+    for mode, name in (('default', 'default'), ('validate_once', 'cached')):
+        print('{0:>14}: {1:.2f} us/read'.format(mode, read_latency(name, reads)))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:2]])
@@ -16,7 +16,7 @@
 """
 dpp : programming patterns made easy!
 """
-from .composite import composite
+from .composite import Aggregate, FirstOf, composite
 
 __author__ = 'Massimiliano Culpo'
 __copyright__ = 'Copyright (c) 2016 Massimiliano Culpo'
@@ -16,14 +16,23 @@
 """Everything you need to employ the composite pattern"""
 from __future__ import absolute_import, print_function
 
+import bisect
 import functools
 import inspect
+import threading
+import timeit
+import weakref
 
 try:
     from collections.abc import MutableSequence
 except ImportError:
     from collections import MutableSequence
 
+try:
+    from concurrent import futures
+except ImportError:  # pragma: no cover
+    futures = None
+
 import six
 
 from .inspection import is_private, is_special
@@ -34,6 +43,9 @@ class _CompositeContainer(MutableSequence):  # pylint: disable = too-many-ancest
 
     This container is basically a list that permits to append items with a
     name, and retrieve them by name. It doesn't permit to set them by name.
+
+    Every modification is announced to :meth:`_adding` and notified to :meth:`_changed`,
+    which containers maintaining additional data structures override.
     """
 
     def __init__(self):
@@ -49,9 +61,11 @@ class _CompositeContainer(MutableSequence):  # pylint: disable = too-many-ancest
         :param value: value to be appended
         :param name: name to be associated with the value (optional)
         """
+        self._adding((value, ))
         if name is not None:
             self._named_items[name] = value
-        super(_CompositeContainer, self).append(value)
+        self._items.append(value)
+        self._changed((value, ), (), True)
 
     def __contains__(self, item):
         """Try to look-up by name first, delegate to list later."""
@@ -68,31 +82,797 @@ class _CompositeContainer(MutableSequence):  # pylint: disable = too-many-ancest
         # Otherwise delegate to list
         return self._items[item]
 
+    def __iter__(self):
+        return iter(self._items)
+
     def _cleanup_named_items(self):
         self._named_items = dict([(k, v) for k, v in self._named_items.items() if v in self._items])
 
     def __setitem__(self, key, value):
+        removed = self._items[key]
+        if isinstance(key, slice):
+            value = list(value)
+        self._adding(value if isinstance(key, slice) else (value, ))
+
         # Delegate to list for setting
         self._items[key] = value
 
         # Cleanup the dictionary appropriately
         self._cleanup_named_items()
+        if isinstance(key, slice):
+            self._changed(value, removed, False)
+        else:
+            self._changed((value, ), (removed, ), False)
 
     def __delitem__(self, key):
+        removed = self._items[key]
+
         # Delegate to list for deletion
         del self._items[key]
 
         # Cleanup the dictionary appropriately
         self._cleanup_named_items()
+        self._changed((), removed if isinstance(key, slice) else (removed, ), False)
 
     def __len__(self):
         return len(self._items)
 
     def insert(self, index, value):
+        self._adding((value, ))
+        appended = index >= len(self._items)
         self._items.insert(index, value)
+        self._changed((value, ), (), appended)
+
+    def _adding(self, added):
+        """Called before items are added to the container. If it raises, the container
+        is left unchanged.
+
+        :param added: items that are going to be added
+        """
+
+    def _changed(self, added, removed, appended):
+        """Called after each modification of the container.
+
+        :param added: items that were added
+        :param removed: items that were removed
+        :param appended: True if the added items were placed at the end of the container
+        """
+
+    def _targets(self, name):
+        """Return the items a call to the method 'name' is dispatched to.
+
+        :param name: name of the method
+        :return: iterable of items
+        """
+        # pylint: disable=unused-argument
+        return self._items
+
+
+def _overrides(cls, name, func):
+    """Returns True if cls provides its own implementation of a method, False if it
+    resolves the method to the one of the interface and None if it has no such attribute
+
+    :param cls: class to be inspected
+    :param name: name of the method
+    :param func: implementation provided by the interface (None if there's no interface)
+    :return: True, False or None
+    """
+    attr = getattr(cls, name, None)
+    if attr is None:
+        return None
+    if func is None:
+        return True
+    # Unwrap python 2 unbound methods
+    return getattr(attr, '__func__', attr) is not getattr(func, '__func__', func)
+
+
+class _IndexedCompositeContainer(_CompositeContainer):  # pylint: disable = too-many-ancestors
+    """Container that keeps an index from method names to the items that implement them,
+    so that calls are dispatched only to the items overriding the interface.
+
+    The index is built on the first dispatch and then updated in place by every
+    modification. Assignments and deletions by slice make it rebuild on next dispatch.
+    Whether an item implements a method is decided when it is indexed: items whose type
+    has no such method are indexed if the instance provides it, e.g. through an instance
+    attribute or ``__getattr__``.
+    """
+
+    _interface_methods = {}  # Methods to be indexed: {name: implementation in the interface}
+
+    def __init__(self):
+        super(_IndexedCompositeContainer, self).__init__()
+        self._implementers = None  # {name: [items]}, or None if it needs to be rebuilt
+        self._positions = None  # Positions of the implementers: {name: [position, ...]}
+        # Cache of the methods of each type: {type: (overridden, missing, inherited)}
+        self._implemented_by_type = {}
+
+    def _implemented(self, item):
+        cls = type(item)
+        names = self._implemented_by_type.get(cls)
+        if names is None:
+            overrides = dict((name, _overrides(cls, name, func))
+                             for name, func in self._interface_methods.items())
+            names = tuple(
+                frozenset(name for name, value in overrides.items() if value is verdict)
+                for verdict in (True, None, False))
+            self._implemented_by_type[cls] = names
+        overridden, missing, inherited = names
+        if not missing and not inherited:
+            return overridden
+        # The instance may still provide the methods its type doesn't override
+        instance_dict = getattr(item, '__dict__', {})
+        return overridden.union([name for name in missing if hasattr(item, name)],
+                                [name for name in inherited if name in instance_dict])
+
+    def _index(self, position, item):
+        for name in self._implemented(item):
+            positions = self._positions[name]
+            idx = bisect.bisect_left(positions, position)
+            positions.insert(idx, position)
+            self._implementers[name].insert(idx, item)
+
+    def _unindex(self, position):
+        # Look at every method, as the item might have changed since it was indexed
+        for name, positions in self._positions.items():
+            idx = bisect.bisect_left(positions, position)
+            if idx < len(positions) and positions[idx] == position:
+                del positions[idx]
+                del self._implementers[name][idx]
+
+    def _shift(self, position, offset):
+        # Move by offset all the implementers at or after position
+        for positions in self._positions.values():
+            idx = bisect.bisect_left(positions, position)
+            positions[idx:] = [item + offset for item in positions[idx:]]
+
+    def append(self, value, name=None):
+        super(_IndexedCompositeContainer, self).append(value, name)
+        if self._implementers is not None:
+            self._index(len(self._items) - 1, value)
+
+    def __setitem__(self, key, value):
+        super(_IndexedCompositeContainer, self).__setitem__(key, value)
+        if isinstance(key, slice):
+            self._implementers = None
+        if self._implementers is None:
+            return
+        position = key % len(self._items)
+        self._unindex(position)
+        self._index(position, value)
+
+    def __delitem__(self, key):
+        super(_IndexedCompositeContainer, self).__delitem__(key)
+        if isinstance(key, slice):
+            self._implementers = None
+        if self._implementers is None:
+            return
+        position = key % (len(self._items) + 1)
+        self._unindex(position)
+        self._shift(position, -1)
+
+    def insert(self, index, value):
+        size = len(self._items)
+        position = min(max(index + size if index < 0 else index, 0), size)
+        super(_IndexedCompositeContainer, self).insert(index, value)
+        if self._implementers is not None:
+            self._shift(position, 1)
+            self._index(position, value)
+
+    def _targets(self, name):
+        if self._implementers is None:
+            self._implementers = dict((name, []) for name in self._interface_methods)
+            self._positions = dict((name, []) for name in self._interface_methods)
+            for position, item in enumerate(self._items):
+                self._index(position, item)
+        return self._implementers[name]
+
+
+class _TreeCompositeContainer(_CompositeContainer):  # pylint: disable = too-many-ancestors
+    """Container for trees of composites, that keeps a cached flattened view of the leaves.
+
+    Items that are tree containers themselves are expanded into their own leaves.
+    The cached view is invalidated when the container, or any container below it,
+    is modified.
+    """
+
+    _flattened = frozenset()  # Names of the methods dispatched to the flattened leaves
+
+    def __init__(self):
+        super(_TreeCompositeContainer, self).__init__()
+        self._parents = []  # Tree containers this container is an item of
+        self._leaves = None  # Flattened view of the leaves, or None if it needs to be rebuilt
+
+    def _invalidate(self):
+        # If the view is already invalid so are the views of the ancestors, as they
+        # are built from the view of this container
+        if self._leaves is None:
+            return
+        self._leaves = None
+        for parent in self._parents:
+            parent._invalidate()  # pylint: disable=protected-access
+
+    def _changed(self, added, removed, appended):
+        super(_TreeCompositeContainer, self)._changed(added, removed, appended)
+        # pylint: disable=protected-access
+        for item in removed:
+            if isinstance(item, _TreeCompositeContainer):
+                item._parents.remove(self)
+        for item in added:
+            if isinstance(item, _TreeCompositeContainer):
+                item._parents.append(self)
+        self._invalidate()
+
+    def _flat_leaves(self):
+        leaves = self._leaves
+        if leaves is None:
+            leaves = []
+            for item in self._items:
+                if isinstance(item, _TreeCompositeContainer):
+                    leaves.extend(item._flat_leaves())  # pylint: disable=protected-access
+                else:
+                    leaves.append(item)
+            self._leaves = leaves
+        return leaves
+
+    def _targets(self, name):
+        if name in self._flattened:
+            return self._flat_leaves()
+        return self._items
+
+
+class _WeakCompositeContainer(_CompositeContainer):  # pylint: disable = too-many-ancestors
+    """Container that holds weak references to its items.
+
+    Items that are garbage collected are dropped automatically: their names are
+    removed right away by a weak reference callback, while the references in the
+    list are compacted lazily, before the next access by position. Dispatch skips
+    dead references and never compacts.
+    """
+
+    def __init__(self):
+        super(_WeakCompositeContainer, self).__init__()
+        self._dead = 0  # Dead references in self._items
+        self._names_of = {}  # Names associated with each reference: {id(ref): [name, ...]}
+        container = weakref.ref(self)
+
+        def on_collected(ref):
+            self = container()  # pylint: disable=redefined-outer-name
+            if self is None:
+                return
+            self._dead += 1
+            for name in self._names_of.pop(id(ref), ()):
+                if self._named_items.get(name) is ref:
+                    del self._named_items[name]
+
+        self._on_collected = on_collected
+
+    def _compact(self):
+        if self._dead:
+            self._items = [ref for ref in self._items if ref() is not None]
+            self._dead = 0
+
+    def _ref(self, value):
+        return weakref.ref(value, self._on_collected)
+
+    def append(self, value, name=None):
+        self._adding((value, ))
+        ref = self._ref(value)
+        if name is not None:
+            previous = self._named_items.get(name)
+            if previous is not None:
+                self._names_of[id(previous)].remove(name)
+            self._named_items[name] = ref
+            self._names_of.setdefault(id(ref), []).append(name)
+        self._items.append(ref)
+        self._changed((value, ), (), True)
+
+    def __getitem__(self, item):
+        if isinstance(item, six.string_types):
+            return self._named_items[item]()
+        self._compact()
+        if isinstance(item, slice):
+            return [ref() for ref in self._items[item]]
+        return self._items[item]()
+
+    def __iter__(self):
+        for ref in self._items:
+            item = ref()
+            if item is not None:
+                yield item
+
+    def _cleanup_named_items(self):
+        alive = set(id(ref) for ref in self._items)
+        self._named_items = dict(
+            (k, v) for k, v in self._named_items.items() if id(v) in alive)
+        self._names_of = dict((k, v) for k, v in self._names_of.items() if k in alive)
+
+    def __setitem__(self, key, value):
+        self._compact()
+        removed = self[key]
+        added = list(value) if isinstance(key, slice) else [value]
+        self._adding(added)
+        refs = [self._ref(item) for item in added]
+        self._items[key] = refs if isinstance(key, slice) else refs[0]
+        self._cleanup_named_items()
+        self._changed(added, removed if isinstance(key, slice) else (removed, ), False)
+
+    def __delitem__(self, key):
+        self._compact()
+        removed = self[key]
+        del self._items[key]
+        self._cleanup_named_items()
+        self._changed((), removed if isinstance(key, slice) else (removed, ), False)
+
+    def __len__(self):
+        self._compact()
+        return len(self._items)
+
+    def insert(self, index, value):
+        self._adding((value, ))
+        self._compact()
+        appended = index >= len(self._items)
+        self._items.insert(index, self._ref(value))
+        self._changed((value, ), (), appended)
+
+    def _targets(self, name):
+        return self
+
+
+class _CopyOnWriteCompositeContainer(_CompositeContainer):  # pylint: disable = too-many-ancestors
+    """Container that can be modified while other threads dispatch calls to its items.
+
+    Items and names are held in an immutable snapshot. Writers serialize on a lock, build
+    a new snapshot and publish it with a single assignment, while readers iterate the
+    snapshot they got without any locking. Each read reads the published snapshot once.
+
+    Each modification is atomic, but those composed of a read and a modification, like
+    :meth:`pop` and :meth:`remove`, are not atomic when several threads write.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # Serializes writers
+        self._snapshot = ((), {})  # Published (items, named items)
+        super(_CopyOnWriteCompositeContainer, self).__init__()
 
+    def _get_items(self):
+        return self._snapshot[0]
 
-def composite(interface=None, method_list=None, reductions=None):
+    def _set_items(self, items):
+        self._snapshot = (tuple(items), self._snapshot[1])
+
+    def _get_named_items(self):
+        return self._snapshot[1]
+
+    def _set_named_items(self, named_items):
+        self._snapshot = (self._snapshot[0], dict(named_items))
+
+    _items = property(_get_items, _set_items)
+    _named_items = property(_get_named_items, _set_named_items)
+
+    def __getitem__(self, item):
+        value = super(_CopyOnWriteCompositeContainer, self).__getitem__(item)
+        return list(value) if isinstance(item, slice) else value
+
+    def __contains__(self, item):
+        items, named_items = self._snapshot
+        if item in named_items:
+            return named_items[item]
+        return item in items
+
+    def __reversed__(self):
+        return reversed(self._items)
+
+    def index(self, value, *args):
+        return self._items.index(value, *args)
+
+    def count(self, value):
+        return self._items.count(value)
+
+    @staticmethod
+    def _cleanup(items, named_items):
+        return dict([(k, v) for k, v in named_items.items() if v in items])
+
+    def append(self, value, name=None):
+        with self._lock:
+            self._adding((value, ))
+            items, named_items = self._snapshot
+            if name is not None:
+                named_items = dict(named_items)
+                named_items[name] = value
+            self._snapshot = (items + (value, ), named_items)
+            self._changed((value, ), (), True)
+
+    def extend(self, values):
+        with self._lock:
+            values = list(values)
+            self._adding(values)
+            items, named_items = self._snapshot
+            self._snapshot = (items + tuple(values), named_items)
+            self._changed(values, (), True)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            items, named_items = self._snapshot
+            items = list(items)
+            removed = items[key]
+            if isinstance(key, slice):
+                value = list(value)
+            self._adding(value if isinstance(key, slice) else (value, ))
+            items[key] = value
+            self._snapshot = (tuple(items), self._cleanup(items, named_items))
+            if isinstance(key, slice):
+                self._changed(value, removed, False)
+            else:
+                self._changed((value, ), (removed, ), False)
+
+    def __delitem__(self, key):
+        with self._lock:
+            items, named_items = self._snapshot
+            items = list(items)
+            removed = items[key]
+            del items[key]
+            self._snapshot = (tuple(items), self._cleanup(items, named_items))
+            self._changed((), removed if isinstance(key, slice) else (removed, ), False)
+
+    def insert(self, index, value):
+        with self._lock:
+            self._adding((value, ))
+            items, named_items = self._snapshot
+            appended = index >= len(items)
+            items = list(items)
+            items.insert(index, value)
+            self._snapshot = (tuple(items), named_items)
+            self._changed((value, ), (), appended)
+
+
+def _none_is_identity(combine):
+    """Returns a combine function for which None is the identity element"""
+
+    def combine_optional(first, second):
+        if first is None:
+            return second
+        if second is None:
+            return first
+        return combine(first, second)
+
+    return combine_optional
+
+
+class _InvertibleAggregateState(object):
+    """State of an aggregate whose combine function can be inverted. Both adding
+    and removing an item cost O(1).
+    """
+
+    def __init__(self, aggregate):
+        self.key = aggregate.key
+        self.combine = aggregate.combine
+        self.inverse = aggregate.inverse
+        self.initial = aggregate.initial
+        self.value = aggregate.initial
+        self.keys = {}  # Keys of the items in the container: {id(item): [key, ...]}
+
+    def add(self, item, key):
+        """Adds the key of an item to the aggregate.
+
+        :param item: item added to the container
+        :param key: key of the item
+        """
+        self.keys.setdefault(id(item), []).append(key)
+        self.value = self.combine(self.value, key)
+
+    def remove(self, item):
+        """Removes the last key added for an item from the aggregate.
+
+        :param item: item removed from the container
+        """
+        keys = self.keys[id(item)]
+        key = keys.pop()
+        if not keys:
+            del self.keys[id(item)]
+        # None, used as identity when no initial value is given, can't be computed by
+        # the inverse: go back to the initial value once the container is empty
+        self.value = self.inverse(self.value, key) if self.keys else self.initial
+
+
+class _SegmentTreeAggregateState(object):
+    """State of an aggregate whose combine function can't be inverted. Keys are
+    stored in the leaves of a segment tree, so adding and removing an item
+    cost O(log n).
+    """
+
+    def __init__(self, aggregate):
+        self.key = aggregate.key
+        self.combine = aggregate.combine
+        self.identity = aggregate.initial
+        self.capacity = 1
+        self.tree = [self.identity] * 2  # Root in 1, leaves from self.capacity on
+        self.free = [0]  # Leaves that are not used
+        self.slots = {}  # Leaves used by the items in the container: {id(item): [slot, ...]}
+
+    @property
+    def value(self):
+        """Combination of the keys of all the items in the container"""
+        return self.tree[1]
+
+    def _set(self, slot, key):
+        tree, combine = self.tree, self.combine
+        idx = slot + self.capacity
+        tree[idx] = key
+        idx //= 2
+        while idx:
+            tree[idx] = combine(tree[2 * idx], tree[2 * idx + 1])
+            idx //= 2
+
+    def _grow(self):
+        old_capacity, self.capacity = self.capacity, 2 * self.capacity
+        tree = [self.identity] * (2 * self.capacity)
+        tree[self.capacity:self.capacity + old_capacity] = self.tree[old_capacity:]
+        for idx in range(self.capacity - 1, 0, -1):
+            tree[idx] = self.combine(tree[2 * idx], tree[2 * idx + 1])
+        self.tree = tree
+        self.free.extend(range(self.capacity - 1, old_capacity - 1, -1))
+
+    def add(self, item, key):
+        """Stores the key of an item in a free leaf.
+
+        :param item: item added to the container
+        :param key: key of the item
+        """
+        if not self.free:
+            self._grow()
+        slot = self.free.pop()
+        self.slots.setdefault(id(item), []).append(slot)
+        self._set(slot, key)
+
+    def remove(self, item):
+        """Frees the last leaf used by an item.
+
+        :param item: item removed from the container
+        """
+        slots = self.slots[id(item)]
+        slot = slots.pop()
+        if not slots:
+            del self.slots[id(item)]
+        self._set(slot, self.identity)
+        self.free.append(slot)
+
+
+class Aggregate(object):
+    """Aggregate over the items of a composite, maintained incrementally.
+
+    Declared as a class attribute of a class decorated with :func:`composite`, it
+    reads as the combination of ``key(item)`` over all the items in the container
+    in O(1). The combine function must be associative and commutative. If an inverse
+    is given, adding and removing items cost O(1), otherwise keys are kept in a
+    segment tree and adding and removing items cost O(log n).
+
+    Keys are computed when an item is added, so items are expected not to change
+    their key while they are in the container.
+    """
+
+    # pylint: disable=too-few-public-methods
+    def __init__(self, key, combine, initial=None, inverse=None):
+        """
+        :param key: function that maps an item to the value being aggregated
+        :param combine: function that combines two values
+        :param initial: identity element of combine. If None, None is treated as the identity
+        :param inverse: function such that inverse(combine(x, y), y) == x (optional)
+        """
+        self.key = key
+        self.combine = combine if initial is not None else _none_is_identity(combine)
+        self.initial = initial
+        self.inverse = inverse
+
+    def _new_state(self):
+        if self.inverse is not None:
+            return _InvertibleAggregateState(self)
+        return _SegmentTreeAggregateState(self)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance._aggregate_states[self].value  # pylint: disable=protected-access
+
+
+class _AggregateCompositeContainer(_CompositeContainer):  # pylint: disable = too-many-ancestors
+    """Container that maintains the aggregates declared in the composite class"""
+
+    _aggregates = ()  # Aggregates declared in the composite class
+
+    def __init__(self):
+        super(_AggregateCompositeContainer, self).__init__()
+        # pylint: disable=protected-access
+        self._aggregate_states = dict(
+            (aggregate, aggregate._new_state()) for aggregate in self._aggregates)
+        self._added_keys = {}  # Keys of the items being added: {state: [key, ...]}
+
+    def _adding(self, added):
+        super(_AggregateCompositeContainer, self)._adding(added)
+        # Keys are computed upfront, so that a failing key leaves everything unchanged
+        self._added_keys = dict((state, [state.key(item) for item in added])
+                                for state in self._aggregate_states.values())
+
+    def _changed(self, added, removed, appended):
+        super(_AggregateCompositeContainer, self)._changed(added, removed, appended)
+        for state in self._aggregate_states.values():
+            for item in removed:
+                state.remove(item)
+            for item, key in zip(added, self._added_keys.get(state, ())):
+                state.add(item, key)
+        self._added_keys = {}
+
+
+class FirstOf(object):
+    """Concurrent dispatch policy that returns as soon as the first k calls succeed.
+
+    Calls are submitted to an executor for all the items at once. Once k of them
+    have succeeded the calls that did not start yet are cancelled, while the ones
+    that are running are ignored. Calls that raise do not count towards k.
+
+    Ignored calls keep their worker busy until they return, and calls dispatched
+    meanwhile queue behind them: slow items can thus saturate the pool and delay
+    every following call. The pool should have room for the calls expected to be
+    in flight, or items prone to hang should get a dedicated ``executor``.
+    """
+
+    # pylint: disable=too-few-public-methods
+    def __init__(self, k=1, timeout=None, executor=None, max_workers=32):
+        """
+        :param k: number of successful results to wait for
+        :param timeout: maximum time in seconds to wait for k results (optional)
+        :param executor: executor used to run the calls. If not given a thread pool
+            is created on first use
+        :param max_workers: number of threads of the pool created on first use, shared
+            by all the calls dispatched through this policy
+        """
+        if futures is None:
+            raise ImportError("FirstOf requires the 'concurrent.futures' module")
+        if k < 1:
+            raise ValueError("'k' should be a positive integer")
+        self.k = k
+        self.timeout = timeout
+        self.executor = executor
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self.executor is None:
+            with self._lock:
+                if self.executor is None:
+                    self.executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        return self.executor
+
+    def _collect(self, pending):
+        """Waits until k of the pending calls succeed, then cancels the calls that did
+        not start yet.
+
+        :param pending: set of futures of the calls
+        :return: tuple with the list of the results received and the last error raised
+        """
+        deadline = None if self.timeout is None else timeit.default_timer() + self.timeout
+        results, error = [], None
+        try:
+            while pending and len(results) < self.k:
+                remaining = None if deadline is None else deadline - timeit.default_timer()
+                done, pending = futures.wait(pending,
+                                             timeout=remaining,
+                                             return_when=futures.FIRST_COMPLETED)
+                if not done:
+                    raise futures.TimeoutError('{0} of {1} results received in {2} s'.format(
+                        len(results), self.k, self.timeout))
+                for future in done:
+                    if future.exception() is None:
+                        results.append(future.result())
+                    else:
+                        error = future.exception()
+        finally:
+            for future in pending:
+                future.cancel()
+        return results[:self.k], error
+
+    def dispatch(self, items, name, args, kwargs, reduction=None):
+        """
+        Call a method on all the items concurrently, and collect the first k results
+
+        :param items: items the call is dispatched to
+        :param name: name of the method
+        :param args: positional arguments of the call
+        :param kwargs: keyword arguments of the call
+        :param reduction: reduction function applied to each result (optional)
+
+        :return: the last value returned by the reduction function if given, otherwise
+            the first result if k is 1, or the list of the first k results. As for
+            sequential dispatch, None is returned if there are no items, while fewer
+            than k successful calls raise the last error, or RuntimeError if none failed
+        """
+        executor = self._get_executor()
+        pending = set(executor.submit(getattr(item, name), *args, **kwargs) for item in items)
+        if not pending:
+            return None
+
+        results, error = self._collect(pending)
+        if len(results) < self.k:
+            if error is not None:
+                raise error
+            raise RuntimeError('{0} of {1} results received from {2} items'.format(
+                len(results), self.k, len(pending)))
+
+        if reduction is not None:
+            value = None
+            for result in results:
+                value = reduction(result)
+            return value
+        return results[0] if self.k == 1 else results
+
+
+class _ContainerOptions(object):
+    """Options of :func:`composite` that select the container of the composite"""
+
+    # pylint: disable=too-few-public-methods
+    def __init__(self, index, flatten, weak, copy_on_write):
+        if index and flatten:
+            raise TypeError("'index' and 'flatten' cannot be combined on a call to composite")
+        if weak and (index or flatten):
+            raise TypeError("'weak' cannot be combined with 'index' or 'flatten'")
+        if copy_on_write and (index or flatten or weak):
+            raise TypeError(
+                "'copy_on_write' cannot be combined with 'index', 'flatten' or 'weak'")
+        self.index = index
+        self.flatten = flatten
+        self.weak = weak
+        self.copy_on_write = copy_on_write
+
+    def containers(self, cls, methods, dictionary_for_type_call):
+        """Returns the containers providing the optional features, that are combined
+        through cooperative inheritance, and sets the class attributes they need.
+
+        :param cls: class being decorated
+        :param methods: methods of the composite: {name: descriptor}
+        :param dictionary_for_type_call: attributes of the composite class
+        :return: tuple of containers
+        """
+        containers = []
+        aggregates = [x for x in inspect.classify_class_attrs(cls)
+                      if isinstance(x.object, Aggregate)]
+        if aggregates:
+            for item in aggregates:
+                if item.name in methods:
+                    raise TypeError("Aggregate '{0}' has the same name of a method".format(
+                        item.name))
+            if self.weak:
+                raise TypeError("'weak' cannot be combined with aggregates")
+            dictionary_for_type_call['_aggregates'] = tuple(item.object for item in aggregates)
+            containers.append(_AggregateCompositeContainer)
+
+        if self.index:
+            interface_methods = dict((name, getattr(descriptor.func, '__func__', descriptor.func))
+                                     for name, descriptor in methods.items())
+            dictionary_for_type_call['_interface_methods'] = interface_methods
+            containers.append(_IndexedCompositeContainer)
+
+        if self.flatten:
+            flattened = methods if self.flatten is True else self.flatten
+            dictionary_for_type_call['_flattened'] = frozenset(flattened)
+            containers.append(_TreeCompositeContainer)
+
+        if self.weak:
+            containers.append(_WeakCompositeContainer)
+
+        if self.copy_on_write:
+            containers.append(_CopyOnWriteCompositeContainer)
+
+        return tuple(containers)
+
+
+# The container options are keyword arguments of the public interface
+def composite(interface=None,  # pylint: disable=too-many-arguments
+              method_list=None,
+              reductions=None,
+              index=False,
+              flatten=False,
+              weak=False,
+              copy_on_write=False,
+              fanout=None):
     """Returns a class decorator that patches a class adding all the methods it needs
     to be a composite for a given interface.
 
@@ -100,6 +880,23 @@ def composite(interface=None, method_list=None, reductions=None):
         Only non-private and non-special instance methods will be patched
     :param method_list: names of methods that should be part of the composite
     :param reductions: dictionary that maps method names to reduction function
+    :param index: if True, calls are dispatched only to the items that override the method
+        of the interface (or, for methods in method_list, that have the method)
+    :param flatten: True, or names of the methods, to dispatch calls directly to the leaves
+        of a tree of composites decorated with this option. Reductions are then applied
+        once per leaf by the composite being called, while methods that are not flattened
+        recurse into each sub-composite and apply its reduction
+    :param weak: if True, the container holds weak references to its items, which are
+        dropped once they are garbage collected. Can't be combined with other options
+        that keep track of the items, i.e. 'index', 'flatten' and aggregates
+    :param copy_on_write: if True, the container can be modified while other threads call
+        its methods: writers publish immutable snapshots of the items, that calls iterate
+        without locking. Can't be combined with 'index', 'flatten' or 'weak'
+    :param fanout: dictionary that maps method names to a concurrent dispatch policy,
+        like :class:`FirstOf`
+
+    Attributes of the decorated class that are instances of :class:`Aggregate` are
+    maintained incrementally as items are added to and removed from the container.
 
     :return: class decorator
     """
@@ -112,6 +909,12 @@ def composite(interface=None, method_list=None, reductions=None):
         raise TypeError(
             "'reduction' should be a dictionary mapping method names to reduction functions")
 
+    if fanout is not None and not isinstance(fanout, dict):
+        raise TypeError(
+            "'fanout' should be a dictionary mapping method names to dispatch policies")
+
+    options = _ContainerOptions(index, flatten, weak, copy_on_write)
+
     def cls_decorator(cls):
         # pylint: disable=missing-docstring
         # Retrieve the base class of the composite. Inspect its methods and decide which ones
@@ -141,9 +944,15 @@ def composite(interface=None, method_list=None, reductions=None):
 
             def __get__(self, instance, owner):
                 reduction_function = self.reductions.get(self.name, None)
+                policy = fanout.get(self.name) if fanout is not None else None
 
                 def getter(*args, **kwargs):
-                    for item in instance:
+                    # pylint: disable=protected-access
+                    if policy is not None:
+                        return policy.dispatch(instance._targets(self.name), self.name, args,
+                                               kwargs, reduction_function)
+                    value = None
+                    for item in instance._targets(self.name):
                         value = getattr(item, self.name)(*args, **kwargs)
                         if reduction_function is not None:
                             value = reduction_function(value)
@@ -165,7 +974,7 @@ def composite(interface=None, method_list=None, reductions=None):
                 method_list_dict[name] = IterateOver(name)
             dictionary_for_type_call.update(method_list_dict)
         # Construct a dictionary with the methods inspected from the interface
-        bases = (cls, _CompositeContainer)
+        bases = (cls, )
         if interface is not None:
             # If an interface is passed, class methods and static methods should not be inserted
             # in the list of methods to be wrapped
@@ -177,7 +986,11 @@ def composite(interface=None, method_list=None, reductions=None):
             interface_methods_dict = dict((item.name, IterateOver(item.name, item.object))
                                           for item in interface_methods)
             dictionary_for_type_call.update(interface_methods_dict)
-            bases = (cls, interface, _CompositeContainer)
+            bases = (cls, interface)
+
+        containers = options.containers(cls, dict(dictionary_for_type_call),
+                                        dictionary_for_type_call)
+        bases += containers or (_CompositeContainer, )
 
         # Generate the new class on the fly and return it
         wrapper_class = type(cls.__name__, bases, dictionary_for_type_call)
@@ -14,49 +14,731 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Provides the expected descriptor"""
+import threading
+import weakref
+
+
+def _format_message(descriptor, instance, value, details=None):
+    """
+    Format the message of a descriptor for a value that is not valid
+
+    :param descriptor: descriptor holding the message template
+    :param instance: instance holding the value
+    :param value: value that is not valid
+    :param details: additional fields used to format the message (optional)
+    :return: formatted message
+    """
+    context = dict(descriptor.__dict__)
+    context['value'] = value
+    if details is not None:
+        context.update(details)
+    message = descriptor.message.format(**context)
+    return message + '\n\ttriggered from instance {0}'.format(repr(instance))
+
+
+class _LazyMessage(object):
+    """Message that is formatted only when it is converted to a string"""
+
+    __slots__ = ('descriptor', 'instance', 'value', 'details')
+
+    def __init__(self, descriptor, instance, value, details=None):
+        self.descriptor = descriptor
+        self.instance = instance
+        self.value = value
+        self.details = details  # Additional fields used to format the message
+
+    def __str__(self):
+        return _format_message(self.descriptor, self.instance, self.value, self.details)
+
+    def __repr__(self):
+        return repr(str(self))
+
+
+class Result(object):
+    """Outcome of reading an Expected attribute in ``result`` mode.
+
+    Holds either the value or an error code (the class of the exception that
+    would have been raised) together with a lazily formatted message.
+    """
+
+    __slots__ = ('value', 'error', 'message')
+
+    def __init__(self, value=None, error=None, message=None):
+        self.value = value
+        self.error = error
+        self.message = message
+
+    @property
+    def valid(self):
+        """True if the value is valid, False otherwise"""
+        return self.error is None
+
+    def __bool__(self):
+        return self.error is None
+
+    __nonzero__ = __bool__
+
+    def exception(self):
+        """
+        Return the exception describing why the value is not valid
+
+        :return: exception instance or None
+        """
+        if self.error is None:
+            return None
+        return self.error(str(self.message))
+
+    def unwrap(self):
+        """
+        Return the value if it is valid, otherwise raise the exception
+
+        :return: value
+        """
+        if self.error is not None:
+            raise self.error(str(self.message))
+        return self.value
+
+    def __repr__(self):
+        if self.error is None:
+            return 'Result({0!r})'.format(self.value)
+        return 'Result(error={0}, message={1!r})'.format(self.error.__name__, self.message)
 
 
 class Expected(object):
     """Descriptor that holds a value or the exception explaining
-    why the value was not set
+    why the value was not set.
+
+    Values are stored per instance: in the instance dictionary under the name
+    of the attribute or, for instances without a dictionary, in a slot named like the
+    attribute with a leading underscore (e.g. ``__slots__ = ('_value',)`` for ``value``).
+
+    In ``validate_once`` mode the predicate runs once per assigned value and its outcome
+    is stored next to the value, so that subsequent reads don't call the predicate again.
+    Mutable values that are modified in place must be re-validated calling
+    :meth:`invalidate`.
+
+    In ``result`` mode reading the attribute never raises: it returns a :class:`Result`
+    holding either the value or the error, so that failing reads cost about as much as
+    successful ones.
     """
 
+    # Whether validity is just predicate(value) on the stored value, so that bulk
+    # validation can check it inline. Subclasses storing or checking values
+    # differently set it to False.
+    _plain = True
+
     # pylint: disable=too-few-public-methods
     def __init__(self,
                  predicate,
                  exc_cls=RuntimeError,
                  message='Invalid value set',
-                 trigger_on_set=False):
+                 trigger_on_set=False,
+                 validate_once=False,
+                 result=False):
         """
         Initializes the descriptor with the predicate and optional information
 
         :param predicate: predicate used to validate the value to be held
         :param exc_cls: class of the exception that will be raised is the predicate returns False
-        :param message: exception message
+        :param message: exception message, formatted with the attributes of the descriptor
+            and the offending ``value``
         :param trigger_on_set: whether or not to trigger the exception when the value is set
+        :param validate_once: whether or not to cache the outcome of the predicate
+            for each assigned value
+        :param result: whether or not reading the attribute returns a :class:`Result`
+            instead of raising
         """
+        # pylint: disable=too-many-arguments
         self.predicate = predicate
         self.exc_cls = exc_cls
         self.message = message
         self.trigger_on_set = trigger_on_set
-        self.value = None
+        self.validate_once = validate_once
+        self.result = result
+        self.name = None  # Name of the attribute in the owner class
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def _bind(self, owner):
+        # Python < 3.6 doesn't call __set_name__, so look for the descriptor in the owner
+        for klass in owner.__mro__:
+            for name, item in vars(klass).items():
+                if item is self:
+                    self.__set_name__(klass, name)
+                    return
+        raise TypeError('Expected descriptor is not an attribute of {0}'.format(owner.__name__))
+
+    def _load(self, instance, default=None):
+        try:
+            return instance.__dict__.get(self.name, default)
+        except AttributeError:
+            # Instances without a dictionary store the value in a slot
+            return getattr(instance, '_' + self.name, default)
+
+    def _store(self, instance, value):
+        try:
+            instance.__dict__[self.name] = value
+        except AttributeError:
+            try:
+                setattr(instance, '_' + self.name, value)
+            except AttributeError:
+                raise TypeError("'{0}' has no instance dictionary: declare a '_{1}' slot".format(
+                    type(instance).__name__, self.name))
+
+    def _discard(self, instance):
+        try:
+            instance.__dict__.pop(self.name, None)
+        except AttributeError:
+            try:
+                delattr(instance, '_' + self.name)
+            except AttributeError:
+                pass
+
+    def _error(self, instance, value, details=None):
+        return self.exc_cls(_format_message(self, instance, value, details))
+
+    def _check_predicate(self, instance, value):
+        if not self.predicate(value):
+            raise self._error(instance, value)
+
+    def _validity(self, instance):
+        # Return the (value, valid) pair for the value held by instance. In validate_once
+        # mode the storage holds such a pair, where valid is None if the predicate has not
+        # been evaluated yet.
+        if not self.validate_once:
+            value = self._load(instance)
+            return value, self.predicate(value)
+        item = self._load(instance)
+        value, valid = item if item is not None else (None, None)
+        if valid is None:
+            valid = bool(self.predicate(value))
+            self._store(instance, (value, valid))
+        return value, valid
+
+    def _load_validated(self, instance):
+        value, valid = self._validity(instance)
+        if not valid:
+            raise self._error(instance, value)
+        return value
+
+    def _load_result(self, instance):
+        value, valid = self._validity(instance)
+        if valid:
+            return Result(value)
+        return Result(None, self.exc_cls, _LazyMessage(self, instance, value))
+
+    def _check(self, instance):
+        # Exception describing why the value held by instance is not valid, or None
+        value, valid = self._validity(instance)
+        if valid:
+            return None
+        return self._error(instance, value)
+
+    def invalidate(self, instance):
+        """
+        Forget the outcome of the predicate for the value held by an instance, so that
+        it will be evaluated again on next read. Has no effect unless in validate_once mode.
 
-    def _check_predicate(self, instance):
-        if not self.predicate(self.value):
-            self.message += '\n\ttriggered from instance {0}'.format(repr(instance))
-            raise self.exc_cls(self.message.format(**self.__dict__))
+        :param instance: instance holding the value
+        """
+        if not self.validate_once:
+            return
+        if self.name is None:
+            self._bind(type(instance))
+        item = self._load(instance)
+        if item is not None:
+            self._store(instance, (item[0], None))
 
     def __get__(self, instance, owner):
-        self._check_predicate(instance)
-        return self.value
+        if instance is None:
+            return self
+        if self.name is None:
+            self._bind(owner)
+        if self.result:
+            return self._load_result(instance)
+        if self.validate_once:
+            return self._load_validated(instance)
+        value = self._load(instance)
+        self._check_predicate(instance, value)
+        return value
 
     def __set__(self, instance, value):
-        self.value, old_value = value, self.value
+        if self.name is None:
+            self._bind(type(instance))
         if self.trigger_on_set:
+            # Check before storing, so that the old value is kept
+            # in case client wants to manage the exception
+            self._check_predicate(instance, value)
+        if self.validate_once:
+            value = (value, True if self.trigger_on_set else None)
+        self._store(instance, value)
+
+
+def _numpy():
+    """Import numpy on demand, as it is an optional dependency needed only by ExpectedArray"""
+    try:
+        import numpy  # pylint: disable=import-error
+    except ImportError:  # pragma: no cover
+        raise ImportError('ExpectedArray requires numpy')
+    return numpy
+
+
+def finite(array):
+    """Vectorized predicate that accepts finite elements"""
+    return _numpy().isfinite(array)
+
+
+def in_range(lower=None, upper=None):
+    """
+    Returns a vectorized predicate that accepts elements in the closed interval [lower, upper]
+
+    :param lower: lower bound (optional)
+    :param upper: upper bound (optional)
+    :return: vectorized predicate
+    """
+
+    def predicate(array):
+        numpy = _numpy()
+        mask = numpy.ones(numpy.shape(array), dtype=bool)
+        if lower is not None:
+            mask &= array >= lower
+        if upper is not None:
+            mask &= array <= upper
+        return mask
+
+    return predicate
+
+
+class ExpectedArray(Expected):
+    """Expected descriptor for NumPy arrays.
+
+    Elements are checked by vectorized predicates that return a boolean mask, while
+    the type and the shape of the array are checked against ``dtype`` and ``shape``.
+    Arrays are validated once per assigned value, and partial updates done through
+    :meth:`update` re-validate only the region being modified. On failure the
+    message reports how many elements are offending and a sample of their indices.
+    """
+
+    _plain = False
+
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 predicate=None,
+                 dtype=None,
+                 shape=None,
+                 exc_cls=RuntimeError,
+                 message='Invalid array set: {reason}',
+                 trigger_on_set=False,
+                 max_indices=5):
+        """
+        :param predicate: vectorized predicate, or list of vectorized predicates, returning
+            a boolean mask of the valid elements
+        :param dtype: type the dtype of the array must be a sub-type of (optional)
+        :param shape: expected shape of the array, where None matches any size (optional)
+        :param exc_cls: class of the exception that will be raised if the array is not valid
+        :param message: exception message, formatted like for :class:`Expected` with
+            the additional ``reason`` field
+        :param trigger_on_set: whether or not to trigger the exception when the array is set
+        :param max_indices: maximum number of offending indices reported
+        """
+        _numpy()
+        if predicate is not None and not isinstance(predicate, (list, tuple)):
+            predicate = [predicate]
+        super(ExpectedArray, self).__init__(predicate,
+                                            exc_cls=exc_cls,
+                                            message=message,
+                                            trigger_on_set=trigger_on_set,
+                                            validate_once=True)
+        self.dtype = dtype
+        self.shape = tuple(shape) if shape is not None else None
+        self.max_indices = max_indices
+
+    def _element_failure(self, values, array=None, key=None):
+        # Reason why some elements of values are offending, or None. If values
+        # is the region array[key], indices are reported with respect to array.
+        if self.predicate is None:
+            return None
+        numpy = _numpy()
+        mask = numpy.ones(numpy.shape(values), dtype=bool)
+        for predicate in self.predicate:
+            mask &= numpy.asarray(predicate(values), dtype=bool)
+        if mask.all():
+            return None
+        offending = ~mask
+        array = values if array is None else array
+        positions = numpy.arange(array.size).reshape(array.shape)
+        if key is not None:
+            positions = numpy.asarray(positions[key])
+        sample = positions[offending][:self.max_indices]
+        indices = list(zip(*[x.tolist() for x in numpy.unravel_index(sample, array.shape)]))
+        if array.ndim == 1:
+            indices = [index for index, in indices]
+        return '{0} offending elements, e.g. at indices {1}'.format(
+            int(numpy.count_nonzero(offending)), indices)
+
+    def _failure(self, array):
+        # Reason why the array is not valid, or None
+        if array is None:
+            return 'no array set'
+        if self.dtype is not None and not _numpy().issubdtype(array.dtype, self.dtype):
+            return 'dtype {0} is not a sub-type of {1}'.format(
+                array.dtype, getattr(self.dtype, '__name__', self.dtype))
+        if self.shape is not None and (
+                len(array.shape) != len(self.shape) or
+                any(size not in (None, actual) for size, actual in zip(self.shape, array.shape))):
+            return 'shape {0} does not match {1}'.format(array.shape, self.shape)
+        return self._element_failure(array)
+
+    def _check_predicate(self, instance, value):
+        reason = self._failure(value)
+        if reason is not None:
+            raise self._error(instance, value, {'reason': reason})
+
+    def _load_validated(self, instance):
+        item = self._load(instance)
+        array, valid = item if item is not None else (None, None)
+        if valid:
+            return array
+        reason = self._failure(array)
+        if reason is None:
+            self._store(instance, (array, True))
+            return array
+        self._store(instance, (array, False))
+        raise self._error(instance, array, {'reason': reason})
+
+    def _check(self, instance):
+        try:
+            self._load_validated(instance)
+        except self.exc_cls as exc:  # pylint: disable=catching-non-exception
+            return exc
+        return None
+
+    def __set__(self, instance, value):
+        super(ExpectedArray, self).__set__(instance, _numpy().asarray(value))
+
+    def update(self, instance, key, value):
+        """
+        Assign value to array[key] in place, validating only the modified region.
+
+        :param instance: instance holding the array
+        :param key: index, slice or mask selecting the region to be modified
+        :param value: value assigned to the region
+        """
+        if self.name is None:
+            self._bind(type(instance))
+        item = self._load(instance)
+        if item is None:
+            raise self._error(instance, None, {'reason': 'no array set'})
+        array, valid = item
+        region = _numpy().array(array[key], copy=True)
+        region[...] = value
+        reason = self._element_failure(region, array, key)
+        if reason is not None and self.trigger_on_set:
+            raise self._error(instance, array, {'reason': reason})
+        array[key] = region
+        if reason is not None:
+            valid = False
+        elif valid is False:
+            valid = None  # The update might have fixed the array
+        self._store(instance, (array, valid))
+
+
+_MISSING = object()  # Marks values that have not been computed yet
+
+
+class LazyExpected(Expected):
+    """Expected descriptor whose value is computed on first access.
+
+    The value is computed calling ``factory(instance)``, validated with the predicate
+    and memoized per instance. Concurrent first reads of the same instance from
+    multiple threads result in a single computation, whose error, if any, is raised
+    in all of them. Values that fail validation are not memoized, so the next read
+    will compute them again. Values that are set directly are validated when they
+    are set, or when they are read if ``trigger_on_set`` is False.
+    """
+
+    _plain = False
+
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 factory,
+                 predicate,
+                 exc_cls=RuntimeError,
+                 message='Invalid value computed',
+                 trigger_on_set=True):
+        """
+        :param factory: callable that computes the value, given the instance
+        :param predicate: predicate used to validate the value to be held
+        :param exc_cls: class of the exception that will be raised is the predicate returns False
+        :param message: exception message
+        :param trigger_on_set: whether or not to trigger the exception when a value is set
+        """
+        super(LazyExpected, self).__init__(predicate,
+                                           exc_cls=exc_cls,
+                                           message=message,
+                                           trigger_on_set=trigger_on_set)
+        self.factory = factory
+        self._lock = threading.Lock()  # Guards the dictionary below
+        # Computations in progress: {id(instance): (lock, [error raised, if any])}
+        self._pending = {}
+
+    def _compute(self, instance):
+        key = id(instance)
+        with self._lock:
+            value = self._load(instance, _MISSING)
+            if value is not _MISSING:
+                return value
+            entry = self._pending.get(key)
+            computing = entry is None
+            if computing:
+                entry = self._pending[key] = (threading.Lock(), [])
+                entry[0].acquire()
+        pending, errors = entry
+
+        if not computing:
+            # Wait for the thread that is computing the value, then share its outcome
+            with pending:
+                pass
+            if errors:
+                raise errors[0]
+            return getattr(instance, self.name)
+
+        try:
+            value = self.factory(instance)
+            self._check_predicate(instance, value)
+            self._store(instance, value)
+            return value
+        except Exception as exc:
+            errors.append(exc)
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.release()
+
+    def _check(self, instance):
+        # Values that are not computed yet are not validated
+        value = self._load(instance, _MISSING)
+        if value is _MISSING or self.predicate(value):
+            return None
+        return self._error(instance, value)
+
+    def reset(self, instance):
+        """
+        Forget the memoized value, so that it will be computed again on next read
+
+        :param instance: instance holding the value
+        """
+        if self.name is None:
+            self._bind(type(instance))
+        self._discard(instance)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        if self.name is None:
+            self._bind(owner)
+        value = self._load(instance, _MISSING)
+        if value is _MISSING:
+            return self._compute(instance)
+        if not self.trigger_on_set:
+            # The value might have been set directly without being validated
+            self._check_predicate(instance, value)
+        return value
+
+
+class AsyncLazyExpected(LazyExpected):
+    """Lazy expected descriptor for factories that return awaitables.
+
+    Reading the attribute returns an :mod:`asyncio` future that resolves to the
+    validated value. The future is memoized per instance, so all the coroutines
+    awaiting the attribute share a single computation. If the computation fails
+    the future is dropped, and the next read starts a new computation.
+    """
+
+    def __init__(self, factory, predicate, exc_cls=RuntimeError, message='Invalid value computed'):
+        """
+        :param factory: callable that returns an awaitable computing the value, given the instance
+        :param predicate: predicate used to validate the value to be held
+        :param exc_cls: class of the exception that will be raised is the predicate returns False
+        :param message: exception message
+        """
+        # Values can't be set, so there's nothing to validate on set or on read
+        super(AsyncLazyExpected, self).__init__(factory,
+                                                predicate,
+                                                exc_cls=exc_cls,
+                                                message=message,
+                                                trigger_on_set=True)
+
+    def _compute(self, instance):
+        import asyncio  # pylint: disable=import-error
+        try:
+            loop = asyncio.get_running_loop()
+        except (AttributeError, RuntimeError):
+            loop = asyncio.get_event_loop()
+        result = loop.create_future()
+        task = asyncio.ensure_future(self.factory(instance))
+
+        def on_computed(task):
+            if result.done():
+                return
+            if task.cancelled():
+                result.cancel()
+            elif task.exception() is not None:
+                result.set_exception(task.exception())
+            elif not self.predicate(task.result()):
+                result.set_exception(self._error(instance, task.result()))
+            else:
+                result.set_result(task.result())
+
+        def on_result(result):
+            if result.cancelled() or result.exception() is not None:
+                task.cancel()
+                if self._load(instance) is result:
+                    self._discard(instance)
+
+        task.add_done_callback(on_computed)
+        result.add_done_callback(on_result)
+        self._store(instance, result)
+        return result
+
+    def _check(self, instance):
+        # Validation happens when the computation completes
+        return None
+
+    def __set__(self, instance, value):
+        raise AttributeError('values of {0} can only be computed by the factory'.format(
+            type(self).__name__))
+
+
+class ValidationError(Exception):
+    """Reports all the failures found by :func:`validate_all` or :func:`validate_many`"""
+
+    def __init__(self, errors):
+        """
+        :param errors: dictionary mapping each invalid attribute (or, for batches, the index
+            of each invalid instance) to the exception describing the failure
+        """
+        super(ValidationError, self).__init__(
+            '{0} validation failures: {1}'.format(len(errors), ', '.join(
+                str(key) for key in sorted(errors))))
+        self.errors = errors
+
+
+class Validator(object):
+    """Validates all the Expected attributes of instances of a given class in one pass"""
+
+    # pylint: disable=too-few-public-methods
+    def __init__(self, owner):
+        """
+        :param owner: class whose Expected attributes will be validated
+        """
+        descriptors = {}
+        for klass in reversed(owner.__mro__):
+            for name, item in vars(klass).items():
+                if isinstance(item, Expected):
+                    descriptors[name] = item
+                else:
+                    descriptors.pop(name, None)
+        # pylint: disable=protected-access
+        plain, checks = [], []
+        for name, descriptor in sorted(descriptors.items()):
+            if descriptor.name is None:
+                descriptor._bind(owner)
+            # Plain descriptors are checked inline on the instance dictionary,
+            # the others delegate to the descriptor
+            if descriptor._plain and not descriptor.validate_once:
+                plain.append((descriptor.name, descriptor.predicate, descriptor))
+            else:
+                checks.append((name, descriptor._check))
+        self.plain = tuple(plain)
+        self.checks = tuple(checks)
+
+    def __call__(self, instance):
+        """
+        Validate an instance
+
+        :param instance: instance to be validated
+        :return: dictionary mapping each invalid attribute to the exception describing
+            the failure (empty if the instance is valid). Predicates that raise are failures,
+            described by the exception they raised
+        """
+        # pylint: disable=protected-access,broad-except
+        errors = {}
+        values = getattr(instance, '__dict__', None)
+        for name, predicate, descriptor in self.plain:
             try:
-                self._check_predicate(instance)
-            except TypeError:
-                # Reset the old value in case client
-                # wants to manage the exception
-                self.value = old_value
-                raise
+                if values is None:
+                    # Values are stored in slots
+                    error = descriptor._check(instance)
+                else:
+                    value = values.get(name)
+                    error = None if predicate(value) else descriptor._error(instance, value)
+            except Exception as exc:
+                error = exc
+            if error is not None:
+                errors[name] = error
+        for name, check in self.checks:
+            try:
+                error = check(instance)
+            except Exception as exc:
+                error = exc
+            if error is not None:
+                errors[name] = error
+        return errors
+
+
+_VALIDATORS = weakref.WeakKeyDictionary()  # Validators compiled for each owner class
+
+
+def _validator(owner):
+    validator = _VALIDATORS.get(owner)
+    if validator is None:
+        validator = _VALIDATORS[owner] = Validator(owner)
+    return validator
+
+
+def validate_all(instance, raise_errors=True):
+    """
+    Validate all the Expected attributes of an instance, reporting every failure together.
+    The attributes to be validated are collected once per class.
+
+    :param instance: instance to be validated
+    :param raise_errors: whether or not to raise a :class:`ValidationError` if some
+        attribute is not valid
+
+    :return: dictionary mapping each invalid attribute to the exception describing
+        the failure (empty if the instance is valid). Predicates that raise are failures,
+        described by the exception they raised
+    """
+    errors = _validator(type(instance))(instance)
+    if errors and raise_errors:
+        raise ValidationError(errors)
+    return errors
+
+
+def validate_many(instances, raise_errors=True):
+    """
+    Validate all the Expected attributes of many instances in one batch call
+
+    :param instances: iterable of instances to be validated
+    :param raise_errors: whether or not to raise a :class:`ValidationError` if some
+        instance is not valid
+
+    :return: dictionary mapping the index of each invalid instance to the dictionary
+        of its failures (empty if all the instances are valid)
+    """
+    errors = {}
+    validators = {}
+    for idx, instance in enumerate(instances):
+        owner = type(instance)
+        validator = validators.get(owner)
+        if validator is None:
+            validator = validators[owner] = _validator(owner)
+        failures = validator(instance)
+        if failures:
+            errors[idx] = failures
+    if errors and raise_errors:
+        raise ValidationError(errors)
+    return errors
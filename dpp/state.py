@@ -15,6 +15,7 @@
 # limitations under the License.
 """State pattern and common variations"""
 import inspect
+import timeit
 
 
 class State(object):
@@ -23,8 +24,9 @@ class State(object):
     """
 
     # pylint: disable=too-few-public-methods
-    def __init__(self, cls, *args):
-        self.data = cls(*args)  # Wrapped object that will act as a state
+    def __init__(self, cls, *args, **kwargs):
+        self.parent = kwargs.pop('parent', None)  # Name of the enclosing SuperState, if any
+        self.data = cls(*args, **kwargs)  # Wrapped object that will act as a state
         self.transitions = {
         }  # Transitions from this to other states in the form {event : next_state}
 
@@ -46,6 +48,55 @@ class State(object):
         return self.transitions.get(event)
 
 
+class SuperState(object):
+    """
+    Group of states that share the transitions triggered from the group itself.
+
+    A finite state machine is always in one of the (leaf) states of a group. When
+    the machine is decorated the hierarchy is flattened, so that each leaf state
+    holds the transitions of all its enclosing super states.
+    """
+
+    # pylint: disable=too-few-public-methods
+    def __init__(self, initial, parent=None, history=None):
+        """
+        :param initial: name of the child entered by default
+        :param parent: name of the enclosing SuperState, if any
+        :param history: None to always enter the initial child, 'shallow' to re-enter
+            the child that was last active or 'deep' to re-enter the leaf state that was
+            last active
+        """
+        if history not in (None, 'shallow', 'deep'):
+            raise ValueError("'history' should be one of None, 'shallow' or 'deep'")
+        self.initial = initial
+        self.parent = parent
+        self.history = history
+
+
+class _HistoryEntry(object):
+    """
+    Entry point of a super state with history. It is the only part of a hierarchy
+    that cannot be flattened, and is resolved when the transition fires.
+    """
+
+    # pylint: disable=too-few-public-methods
+    def __init__(self, name, default):
+        self.name = name  # Name of the super state
+        self.default = default  # Entry point used if the super state was never left
+
+    def resolve(self, history):
+        """
+        Return the leaf state to be entered
+
+        :param history: dictionary mapping super state names to their recorded entry point
+        :return: leaf state
+        """
+        target = history.get(self.name, self.default)
+        while isinstance(target, _HistoryEntry):
+            target = history.get(target.name, target.default)
+        return target
+
+
 class Event(object):
     """
     Represent an event that triggers a transition in the finite state machine
@@ -88,7 +139,237 @@ class FiniteStateMachineBase(object):
         return getattr(self.state, name)
 
 
-def fsm(interface=None, method_list=None):
+class HierarchicalFiniteStateMachineBase(FiniteStateMachineBase):
+    """
+    Operations that are added to finite state machines whose super states have history
+    """
+
+    # pylint: disable=too-few-public-methods
+    def __call__(self, event):
+        """
+        Handle transitions triggered by events, recording the history of the
+        super states that are left and resolving history entry points.
+
+        :param event: event name or Event instance
+        """
+        # pylint: disable=attribute-defined-outside-init
+        event = self.events[event] if not isinstance(event, Event) else event
+        current_state = self.state
+        next_state = current_state.next_state(event)
+        if next_state is not None:
+            history = self.__dict__.setdefault('_history', {})
+            for name, entry in self.history_marks.get(current_state, ()):
+                history[name] = entry
+            if isinstance(next_state, _HistoryEntry):
+                next_state = next_state.resolve(history)
+            self.state = next_state
+
+
+def _entry_resolver(states, superstates):
+    """
+    Returns a function that maps the name of a state, or of a super state, to the
+    entry point of a transition that targets it: either a leaf state or, for super
+    states with history, a :class:`_HistoryEntry`.
+
+    :param states: dictionary of leaf states
+    :param superstates: dictionary of super states
+    :return: entry point resolver
+    """
+    entries = {}
+
+    def entry(name):
+        if name in states:
+            return states[name]
+        if name not in entries:
+            superstate = superstates[name]
+            initial = superstate.initial
+            if initial not in states and initial not in superstates:
+                raise KeyError(initial)
+            if (states.get(initial) or superstates[initial]).parent != name:
+                raise ValueError("'{0}' is not a child of '{1}'".format(initial, name))
+            default = entry(initial)
+            entries[name] = _HistoryEntry(name, default) if superstate.history else default
+        return entries[name]
+
+    return entry
+
+
+def _ancestors(node, superstates):
+    """Yields the (parent name, child) pairs from a node up to the root of its hierarchy"""
+    while node.parent is not None:
+        yield node.parent, node
+        node = superstates[node.parent]
+
+
+def _flatten(states, superstates, events, initial):
+    """
+    Flatten a hierarchy of states, storing in each leaf state the transitions
+    triggered from the leaf itself and from all its enclosing super states.
+
+    :param states: dictionary of leaf states
+    :param superstates: dictionary of super states
+    :param events: dictionary of events
+    :param initial: initial state or super state of the machine
+
+    :return: the initial leaf state and a dictionary mapping each leaf state to the
+        (super state name, entry point) pairs that must be recorded in the history
+        when the leaf state is left
+    """
+    entry = _entry_resolver(states, superstates)
+    events_from = {}
+    for event in events.values():
+        if event.current not in states and event.current not in superstates:
+            raise KeyError(event.current)
+        events_from.setdefault(event.current, []).append(event)
+
+    names = dict((item, name) for name, item in states.items())
+    names.update((item, name) for name, item in superstates.items())
+    history_marks = {}
+    for name, leaf in states.items():
+        for event in events_from.get(name, ()):
+            leaf.transitions[event] = entry(event.next)
+        marks = []
+        for parent, child in _ancestors(leaf, superstates):
+            for event in events_from.get(parent, ()):
+                leaf.transitions[event] = entry(event.next)
+            if superstates[parent].history == 'deep':
+                marks.append((parent, leaf))
+            elif superstates[parent].history == 'shallow':
+                marks.append((parent, entry(names[child])))
+        if marks:
+            history_marks[leaf] = tuple(marks)
+
+    # No history has been recorded when the machine starts
+    if initial in names:
+        initial = entry(names[initial])
+    if isinstance(initial, _HistoryEntry):
+        initial = initial.resolve({})
+    return initial, history_marks
+
+
+class Tracer(object):
+    """
+    Records the most recent transitions of a finite state machine in a ring buffer
+    and counts how many times each transition fired.
+
+    Storage is preallocated, so recording a transition never allocates new containers.
+    """
+
+    def __init__(self, capacity, names=None):
+        """
+        :param capacity: number of transitions kept in the ring buffer
+        :param names: dictionary mapping states and events to their names
+        """
+        self.capacity = capacity
+        self.names = names if names is not None else {}
+        self.counters = {}  # Number of times each transition fired: {(from, event, to): count}
+        # Parallel arrays holding timestamps, starting states, events and next states
+        self._buffer = ([0.0] * capacity, [None] * capacity, [None] * capacity,
+                        [None] * capacity)
+        self._next = 0  # Slot that will be written by the next record
+        self._size = 0  # Number of valid slots in the buffer
+
+    def record(self, current_state, event, next_state):
+        """
+        Record a transition in the ring buffer and update its counter
+
+        :param current_state: state before the transition
+        :param event: event that triggered the transition
+        :param next_state: state after the transition
+        """
+        timestamps, origins, events, targets = self._buffer
+        idx = self._next
+        timestamps[idx] = timeit.default_timer()
+        origins[idx] = current_state
+        events[idx] = event
+        targets[idx] = next_state
+        self._next = (idx + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+        key = (current_state, event, next_state)
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+    def clear(self):
+        """Forget all the transitions recorded so far"""
+        self._next = 0
+        self._size = 0
+        self.counters = {}
+
+    def __len__(self):
+        return self._size
+
+    def _name(self, item):
+        return self.names.get(item, item)
+
+    def dump(self):
+        """
+        Return the transitions in the ring buffer, oldest first
+
+        :return: list of (timestamp, from, event, to) tuples, where states and events are
+            given by name
+        """
+        timestamps, origins, events, targets = self._buffer
+        start = (self._next - self._size) % self.capacity
+        records = []
+        for i in range(self._size):
+            idx = (start + i) % self.capacity
+            records.append((timestamps[idx], self._name(origins[idx]), self._name(events[idx]),
+                            self._name(targets[idx])))
+        return records
+
+    def export(self):
+        """
+        Export the content of the tracer as plain python objects
+
+        :return: dictionary with the recent 'transitions' and the 'counters' of each
+            transition, where states and events are given by name
+        """
+        counters = dict(((self._name(current), self._name(event), self._name(following)), count)
+                        for (current, event, following), count in self.counters.items())
+        return {'transitions': self.dump(), 'counters': counters}
+
+
+class _InstanceTracer(object):
+    """
+    Descriptor that lazily creates a tracer for each finite state machine instance.
+
+    Once created the tracer is stored in the instance dictionary, which takes
+    precedence over this (non-data) descriptor on subsequent look-ups.
+    """
+
+    # pylint: disable=too-few-public-methods
+    def __init__(self, capacity, names):
+        self.capacity = capacity
+        self.names = names
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        tracer = Tracer(self.capacity, self.names)
+        instance.__dict__['tracer'] = tracer
+        return tracer
+
+
+class TracingMixin(object):
+    """
+    Operations that are added to finite state machines that trace their transitions
+    """
+
+    # pylint: disable=too-few-public-methods
+    def __call__(self, event):
+        """
+        Handle transitions triggered by events and record the ones that fired.
+
+        :param event: event name or Event instance
+        """
+        event = self.events[event] if not isinstance(event, Event) else event
+        current_state = self.state
+        super(TracingMixin, self).__call__(event)
+        if current_state.next_state(event) is not None:
+            self.tracer.record(current_state, event, self.state)
+
+
+def fsm(interface=None, method_list=None, trace=None):
     """
     Decorates (patches) a class to construct a finite state machine.
 
@@ -96,6 +377,8 @@ def fsm(interface=None, method_list=None):
 
     :param interface: class providing the interface of the fsm state
     :param method_list: list of methods that each state should provide
+    :param trace: if given, number of transitions each instance keeps in its tracer.
+        When tracing is off (default) handling an event has no additional cost.
 
     :return: class patched to be a finite state machine
     """
@@ -104,6 +387,12 @@ def fsm(interface=None, method_list=None):
     if interface is None and method_list is None:
         raise TypeError("Either 'interface' or 'method_list' must be defined on a call to fsm")
 
+    if trace is not None:
+        if isinstance(trace, bool) or not isinstance(trace, int):
+            raise TypeError("'trace' should be the capacity of the tracer")
+        if trace <= 0:
+            raise ValueError("'trace' should be a positive integer")
+
     def cls_decorator(cls):
         """
         Decorator that patches a class to add finite state machine operations.
@@ -127,15 +416,24 @@ def fsm(interface=None, method_list=None):
                           for item in cls_attributes if isinstance(item.object, State))
         fsm_events = dict((item.name, item.object)
                           for item in cls_attributes if isinstance(item.object, Event))
-        additional_attributes['state'] = fsm_states.pop('__initial__')
+        fsm_superstates = dict((item.name, item.object)
+                               for item in cls_attributes if isinstance(item.object, SuperState))
+        initial = fsm_states.pop('__initial__', None) or fsm_superstates.pop('__initial__')
         additional_attributes['states'] = fsm_states
+        additional_attributes['superstates'] = fsm_superstates
         additional_attributes['events'] = fsm_events
-        # Check states interface
-        for _, event in fsm_events.items():
-            current_state = event.current
-            next_state = event.next
-            # Check that the states exists
-            fsm_states[current_state].transitions[event] = fsm_states[next_state]
+        # Check states interface and flatten the hierarchy of states, if any
+        initial, history_marks = _flatten(fsm_states, fsm_superstates, fsm_events, initial)
+        additional_attributes['state'] = initial
+        if history_marks:
+            additional_attributes['history_marks'] = history_marks
+            bases = (cls, HierarchicalFiniteStateMachineBase)
+
+        if trace is not None:
+            names = dict((item, name) for name, item in fsm_states.items())
+            names.update((item, name) for name, item in fsm_events.items())
+            additional_attributes['tracer'] = _InstanceTracer(trace, names)
+            bases = (cls, TracingMixin) + bases[1:]
 
         return type(cls.__name__, bases, additional_attributes)
 
@@ -16,6 +16,9 @@
 
 from dpp import composite
 
+import gc
+import threading
+
 import pytest
 
 
@@ -161,6 +164,171 @@ class TestCompositeUsage:
         assert 'two' not in composite_object
 
 
+class TestWeakComposite:
+    def test_dead_items_are_dropped(self):
+        @composite(interface=Base, weak=True)
+        class Registry(object):
+            pass
+
+        Base.reset()
+        one, two = One(), Two()
+        registry = Registry()
+        registry.append(one, 'one')
+        registry.append(two, 'two')
+        registry.append(One(), 'temporary')
+        gc.collect()
+
+        assert len(registry) == 2
+        assert 'temporary' not in registry
+        assert registry['one'] is one
+        assert registry[1] is two
+        assert list(registry) == [one, two]
+        registry.add()
+        assert Base.counter == 3
+
+        del two
+        gc.collect()
+        assert list(registry) == [one]
+        assert 'two' not in registry
+        registry.add()
+        assert Base.counter == 4
+
+        # Items kept alive elsewhere can still be managed by position
+        three = Two()
+        registry.insert(0, three)
+        registry[1] = three
+        assert registry[:] == [three, three]
+        assert 'one' not in registry
+        del registry[0]
+        assert len(registry) == 1
+
+    def test_rebound_names(self):
+        @composite(interface=Base, weak=True)
+        class Registry(object):
+            pass
+
+        first, second = One(), Two()
+        registry = Registry()
+        registry.append(first, 'x')
+        registry.append(second, 'x')
+
+        # Collecting the item previously bound to the name leaves the name alone
+        del first
+        gc.collect()
+        assert registry['x'] is second
+
+        del second
+        gc.collect()
+        assert 'x' not in registry
+
+    def test_wrong_options(self):
+        with pytest.raises(TypeError):
+
+            @composite(interface=Base, weak=True, index=True)
+            class Registry(object):
+                pass
+
+
+class TestCopyOnWriteComposite:
+    def test_container(self, composite_items):
+        @composite(interface=Base, copy_on_write=True)
+        class Snapshots(object):
+            pass
+
+        one, two = composite_items
+        composite_object = Snapshots()
+        composite_object.append(one, 'one')
+        composite_object.append(two, 'two')
+        composite_object.add()
+        assert Base.counter == 3
+
+        snapshot = composite_object._items
+        composite_object[:] = [two, two]
+        assert snapshot == (one, two)
+        assert composite_object[:] == [two, two]
+        assert 'one' not in composite_object
+        composite_object.insert(0, one)
+        del composite_object[1]
+        assert list(composite_object) == [one, two]
+        assert composite_object['two'] is two
+
+        # Extending publishes a single snapshot
+        published = []
+
+        class Recording(Snapshots):
+            def _changed(self, added, removed, appended):
+                published.append(self._items)
+
+        composite_object = Recording()
+        composite_object.extend(iter([one, two, one]))
+        assert published == [(one, two, one)]
+
+    def test_concurrent_dispatch(self):
+        sizes = []
+
+        @composite(method_list=['size'], copy_on_write=True)
+        class Snapshots(object):
+            pass
+
+        class Item(object):
+            def __init__(self, owner):
+                self.owner = owner
+
+            def size(self, seen):
+                seen.append(self)
+                return len(self.owner)
+
+        composite_object = Snapshots()
+        composite_object.extend(Item(composite_object) for _ in range(10))
+        stop = threading.Event()
+        errors = []
+
+        def reader():
+            try:
+                while not stop.is_set():
+                    seen = []
+                    composite_object.size(seen)
+                    sizes.append(len(seen))
+            except Exception as exc:  # pylint: disable=broad-except
+                errors.append(exc)
+
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for _ in range(200):
+            composite_object.append(Item(composite_object))
+            composite_object.insert(0, Item(composite_object))
+            del composite_object[1:3]
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        assert not errors
+        # Each call sees one of the published snapshots
+        assert set(sizes) <= set([10, 11, 12])
+        assert len(composite_object) == 10
+
+    def test_lookup_reads_one_snapshot(self):
+        @composite(method_list=['size'], copy_on_write=True)
+        class Snapshots(object):
+            pass
+
+        composite_object = Snapshots()
+
+        class Racing(dict):
+            # A writer publishes a new snapshot right after the name is found
+            def __contains__(self, item):
+                found = super(Racing, self).__contains__(item)
+                del composite_object[0]
+                return found
+
+        item = object()
+        composite_object.append(item, 'x')
+        composite_object._snapshot = (composite_object._items, Racing(x=item))
+        assert 'x' in composite_object
+        assert 'x' not in composite_object
+
+
 class TestCompositeFailures:
     def test_wrong_container(self):
         with pytest.raises(TypeError):
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 Massimiliano Culpo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from dpp import Aggregate, composite
+
+import operator
+
+import pytest
+
+
+class Sized(object):
+    def size(self):
+        raise NotImplementedError('size not implemented')
+
+
+class File(Sized):
+    def __init__(self, size, timestamp):
+        self._size = size
+        self.timestamp = timestamp
+
+    def size(self):
+        return self._size
+
+
+@composite(interface=Sized)
+class Directory(object):
+    total_size = Aggregate(key=lambda f: f.size(), combine=operator.add, initial=0,
+                           inverse=operator.sub)
+    last_modified = Aggregate(key=lambda f: f.timestamp, combine=max)
+
+
+def test_aggregates():
+    directory = Directory()
+    assert directory.total_size == 0
+    assert directory.last_modified is None
+    assert isinstance(Directory.total_size, Aggregate)
+
+    first, second, third = File(10, 3), File(20, 7), File(5, 1)
+    directory.append(first)
+    directory.append(second, 'second')
+    directory.insert(0, third)
+    assert directory.total_size == 35
+    assert directory.last_modified == 7
+    assert directory.size() == 20  # Methods of the interface are still there
+
+    directory.remove(second)
+    assert directory.total_size == 15
+    assert directory.last_modified == 3
+
+    directory[0] = File(1, 12)
+    assert directory.total_size == 11
+    assert directory.last_modified == 12
+
+    # The same item can be held more than once
+    directory.extend([first, first])
+    assert directory.total_size == 31
+    del directory[-1]
+    assert directory.total_size == 21
+    assert directory.last_modified == 12
+
+    del directory[:]
+    assert directory.total_size == 0
+    assert directory.last_modified is None
+
+
+def test_many_items():
+    directory = Directory()
+    files = [File(i, (i * 7) % 101) for i in range(100)]
+    directory.extend(files)
+    assert directory.total_size == sum(range(100))
+    assert directory.last_modified == 100
+    while len(directory) > 1:
+        del directory[len(directory) // 2]
+        expected = list(directory)
+        assert directory.total_size == sum(f.size() for f in expected)
+        assert directory.last_modified == max(f.timestamp for f in expected)
+
+
+@pytest.mark.parametrize('copy_on_write', [False, True])
+def test_failing_key(copy_on_write):
+    @composite(interface=Sized, copy_on_write=copy_on_write)
+    class SafeDirectory(object):
+        total_size = Aggregate(key=lambda f: f.size(), combine=operator.add, initial=0,
+                               inverse=operator.sub)
+        count = Aggregate(key=lambda f: 1, combine=operator.add)
+
+    directory = SafeDirectory()
+    directory.append(File(10, 3))
+
+    # Items whose key can't be computed leave the container unchanged
+    with pytest.raises(NotImplementedError):
+        directory.append(Sized())
+    with pytest.raises(NotImplementedError):
+        directory.insert(0, Sized())
+    with pytest.raises(NotImplementedError):
+        directory[0] = Sized()
+    with pytest.raises(NotImplementedError):
+        directory[:] = [File(1, 1), Sized()]
+    assert len(directory) == 1
+    assert directory.total_size == 10
+    assert directory.count == 1
+
+    del directory[0]
+    assert directory.total_size == 0
+    assert directory.count is None
+
+
+def test_empty_without_initial():
+    @composite(interface=Sized)
+    class Counted(object):
+        count = Aggregate(key=lambda f: 1, combine=operator.add, inverse=operator.sub)
+
+    counted = Counted()
+    assert counted.count is None
+    counted.extend([File(1, 1), File(2, 2)])
+    del counted[0]
+    assert counted.count == 1
+    del counted[0]
+    assert counted.count is None
+
+
+def test_name_clash():
+    with pytest.raises(TypeError):
+
+        @composite(interface=Sized)
+        class WrongDirectory(object):
+            size = Aggregate(key=lambda f: f.size(), combine=operator.add)
+
+
+def test_aggregates_with_index():
+    @composite(interface=Sized, index=True)
+    class IndexedDirectory(object):
+        count = Aggregate(key=lambda f: 1, combine=operator.add)
+
+    directory = IndexedDirectory()
+    directory.extend([File(1, 1), File(2, 2), Sized()])
+    assert directory.count == 3
+    assert directory.size() == 2  # Sized() is skipped, as it doesn't override size
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 Massimiliano Culpo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from dpp import FirstOf, composite
+
+import threading
+import timeit
+
+import pytest
+
+futures = pytest.importorskip('concurrent.futures')
+
+
+class Backend(object):
+    def read(self, key):
+        raise NotImplementedError('read not implemented')
+
+
+class Replica(Backend):
+    def __init__(self, answer, release=None, error=None):
+        self.answer = answer
+        self.release = release  # If given, the replica answers only once it is set
+        self.error = error
+
+    def read(self, key):
+        if self.release is not None:
+            self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return '{0}={1}'.format(key, self.answer)
+
+
+@pytest.fixture
+def release():
+    event = threading.Event()
+    yield event
+    event.set()  # Let the slow replicas terminate
+
+
+def make_replicas(k=1, timeout=None, reductions=None):
+    @composite(interface=Backend, reductions=reductions,
+               fanout={'read': FirstOf(k=k, timeout=timeout)})
+    class Replicas(object):
+        pass
+
+    return Replicas()
+
+
+def test_first_result(release):
+    replicas = make_replicas()
+    replicas.extend([Replica('slow', release), Replica('fast'), Replica('slow', release)])
+    start = timeit.default_timer()
+    assert replicas.read('x') == 'x=fast'
+    assert timeit.default_timer() - start < 1
+
+
+def test_quorum(release):
+    replicas = make_replicas(k=2)
+    replicas.extend([Replica('a'), Replica('slow', release), Replica('b')])
+    assert sorted(replicas.read('x')) == ['x=a', 'x=b']
+
+    answers = []
+    replicas = make_replicas(k=2, reductions={'read': answers.append})
+    replicas.extend([Replica('a'), Replica('slow', release), Replica('b')])
+    replicas.read('y')
+    assert sorted(answers) == ['y=a', 'y=b']
+
+    replicas = make_replicas(k=2, reductions={'read': len})
+    replicas.extend([Replica('a'), Replica('b')])
+    assert replicas.read('z') == 3
+
+
+def test_no_items():
+    # As for sequential dispatch, calls on an empty composite return None
+    replicas = make_replicas(k=2)
+    assert replicas.read('x') is None
+
+
+def test_failures(release):
+    replicas = make_replicas()
+    replicas.extend([Replica('broken', error=KeyError('x')), Replica('ok')])
+    assert replicas.read('x') == 'x=ok'
+
+    replicas = make_replicas()
+    replicas.extend([Replica('broken', error=KeyError('x'))])
+    with pytest.raises(KeyError):
+        replicas.read('x')
+
+    replicas = make_replicas(k=2)
+    replicas.append(Replica('a'))
+    with pytest.raises(RuntimeError):
+        replicas.read('x')
+
+    replicas = make_replicas(timeout=0.05)
+    replicas.extend([Replica('slow', release), Replica('slow', release)])
+    with pytest.raises(futures.TimeoutError):
+        replicas.read('x')
+
+
+def test_wrong_options():
+    with pytest.raises(ValueError):
+        FirstOf(k=0)
+
+    with pytest.raises(TypeError):
+
+        @composite(interface=Backend, fanout=[FirstOf()])
+        class Replicas(object):
+            pass
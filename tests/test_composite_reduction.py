@@ -90,3 +90,157 @@ class TestCompositeReduction:
             @composite(interface=Base, reductions=[])
             class CompositeFromAbcInterface(object):
                 pass
+
+
+class OnlyString(Base):
+    def get_string(self):
+        return '!'
+
+
+class TestIndexedDispatch:
+    def test_dispatch_to_implementers(self, composite_abstract_items):
+        visited = []
+
+        def record(value):
+            visited.append(value)
+            return value
+
+        @composite(interface=Base, reductions={'get_int': record}, index=True)
+        class IndexedComposite(object):
+            pass
+
+        a, b = composite_abstract_items
+        only_string = OnlyString()
+        composite_object = IndexedComposite()
+        composite_object.extend([a, only_string])
+
+        assert composite_object.get_int() == 10
+        assert visited == [10]
+        assert composite_object.get_string() == '!'
+
+        # The index is updated when items are added or removed
+        composite_object.append(b)
+        assert composite_object.get_int() == 11
+        composite_object.insert(0, OnlyString())
+        composite_object.append(OnlyString())
+        del visited[:]
+        assert composite_object.get_int() == 11
+        assert visited == [10, 11]
+        assert composite_object.get_string() == '!'
+
+        composite_object.remove(b)
+        assert composite_object.get_int() == 10
+        composite_object[0] = b
+        del visited[:]
+        assert composite_object.get_int() == 10
+        assert visited == [11, 10]
+
+        del composite_object[:]
+        assert composite_object.get_int() is None
+
+    def test_index_is_updated_in_place(self):
+        @composite(interface=Base, index=True)
+        class IndexedComposite(object):
+            pass
+
+        composite_object = IndexedComposite()
+        composite_object.extend([A(), OnlyString(), B(), A()])
+        composite_object.get_int()  # Builds the index
+        built = composite_object._implementers
+
+        composite_object.insert(-1, OnlyString())
+        composite_object.insert(1, B())
+        composite_object.insert(100, A())
+        del composite_object[-2]
+        del composite_object[0]
+        composite_object[-1] = OnlyString()
+        composite_object[2] = A()
+        composite_object.append(B())
+
+        assert composite_object._implementers is built
+        items = list(composite_object)
+        assert composite_object._targets('get_int') == [
+            x for x in items if not isinstance(x, OnlyString)]
+        assert composite_object._targets('get_string') == items
+        assert composite_object._positions['get_int'] == [
+            i for i, x in enumerate(items) if not isinstance(x, OnlyString)]
+
+    def test_items_providing_methods_on_the_instance(self):
+        class Proxy(object):
+            def __init__(self, target):
+                self.target = target
+
+            def __getattr__(self, name):
+                return getattr(self.target, name)
+
+        @composite(interface=Base, reductions={'get_int': lambda x: x}, index=True)
+        class IndexedComposite(object):
+            pass
+
+        @composite(method_list=['get_int'], index=True)
+        class IndexedList(object):
+            pass
+
+        shadowing = OnlyString()
+        shadowing.get_int = lambda: 12
+        for composite_object in (IndexedComposite(), IndexedList()):
+            composite_object.append(Proxy(A()))
+            assert composite_object.get_int() == 10
+            composite_object.append(shadowing)
+            assert composite_object.get_int() == 12
+            del composite_object[1]
+            assert composite_object.get_int() == 10
+
+    def test_method_list(self):
+        @composite(method_list=['get_int'], index=True)
+        class IndexedComposite(object):
+            pass
+
+        composite_object = IndexedComposite()
+        composite_object.extend([object(), A(), object()])
+        assert composite_object.get_int() == 10
+
+
+class TestTreeDispatch:
+    def test_flattened_leaves(self, composite_abstract_items):
+        visited = []
+
+        def record(value):
+            visited.append(value)
+            return value
+
+        @composite(interface=Base, reductions={'get_int': record}, flatten=['get_int'])
+        class Tree(object):
+            pass
+
+        a, b = composite_abstract_items
+        root, middle, bottom = Tree(), Tree(), Tree()
+        bottom.extend([a, b])
+        middle.append(bottom)
+        middle.append(a)
+        root.extend([middle, b])
+
+        assert root.get_int() == 11
+        assert visited == [10, 11, 10, 11]
+        assert root._flat_leaves() == [a, b, a, b]
+
+        # Changes deep in the tree are seen from the root
+        bottom.append(A())
+        del visited[:]
+        assert root.get_int() == 11
+        assert visited == [10, 11, 10, 10, 11]
+
+        del middle[0]
+        assert root._flat_leaves() == [a, b]
+        bottom.append(b)
+        assert root._flat_leaves() == [a, b]
+
+        # Methods that are not flattened recurse into each sub-composite
+        assert root.get_string() == 'world!'
+
+    def test_wrong_options(self):
+        with pytest.raises(TypeError):
+
+            @composite(interface=Base, index=True, flatten=True)
+            class Tree(object):
+                pass
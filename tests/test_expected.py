@@ -16,6 +16,9 @@
 
 from dpp import expected
 
+import threading
+import time
+
 import pytest
 
 
@@ -56,3 +59,335 @@ def test_expected():
         v = a.greedy_value
         assert v == 'hello'
         assert isinstance(v, str)
+
+
+def test_values_are_per_instance():
+    a, b = A(), A()
+    a.lazy_value = 'hello'
+    b.lazy_value = 'world'
+    assert a.lazy_value == 'hello'
+    assert b.lazy_value == 'world'
+    assert isinstance(A.lazy_value, expected.Expected)
+
+    b.lazy_value = 1
+    assert a.lazy_value == 'hello'
+    for _ in range(3):
+        with pytest.raises(TypeError) as excinfo:
+            b.lazy_value
+    # The message doesn't grow on repeated failures
+    assert str(excinfo.value).startswith('\'1\' is not of type \'str\'')
+    assert str(excinfo.value).count('triggered from instance') == 1
+    assert A.lazy_value.message == '\'{value}\' is not of type \'str\''
+    assert isinstance(excinfo.value.args[0], str)
+
+
+def test_custom_exception_class():
+    class PrefixedError(Exception):
+        def __init__(self, msg):
+            super(PrefixedError, self).__init__('prefix: ' + msg)
+
+    class WithCustomError(object):
+        value = expected.Expected(predicate=lambda x: x > 0, exc_cls=PrefixedError)
+
+    obj = WithCustomError()
+    obj.value = -1
+    with pytest.raises(PrefixedError) as excinfo:
+        obj.value
+    assert str(excinfo.value).startswith('prefix: Invalid value set')
+
+
+def test_slots():
+    class Slotted(object):
+        __slots__ = ('_value', )
+        value = expected.Expected(predicate=lambda x: x > 0, exc_cls=ValueError)
+
+    a, b = Slotted(), Slotted()
+    a.value, b.value = 1, 2
+    assert a.value == 1
+    assert b.value == 2
+    assert not hasattr(a, '__dict__')
+
+    b.value = -1
+    with pytest.raises(ValueError):
+        b.value
+
+    class NoStorage(object):
+        __slots__ = ()
+        value = expected.Expected(predicate=lambda x: x > 0)
+
+    with pytest.raises(TypeError):
+        NoStorage().value = 1
+
+
+def test_validate_once():
+    calls = []
+
+    def is_list(x):
+        calls.append(x)
+        return isinstance(x, list) and all(isinstance(item, int) for item in x)
+
+    class Cached(object):
+        value = expected.Expected(predicate=is_list, exc_cls=TypeError, validate_once=True)
+        greedy = expected.Expected(predicate=is_list,
+                                   exc_cls=TypeError,
+                                   trigger_on_set=True,
+                                   validate_once=True)
+
+    c = Cached()
+    c.value = [1, 2]
+    assert c.value == [1, 2]
+    assert c.value == [1, 2]
+    assert len(calls) == 1
+
+    # In-place modifications go unnoticed until the value is invalidated
+    c.value.append('3')
+    assert c.value == [1, 2, '3']
+    Cached.value.invalidate(c)
+    with pytest.raises(TypeError):
+        c.value
+    with pytest.raises(TypeError):
+        c.value
+    assert len(calls) == 2
+
+    c.value = [3]
+    assert c.value == [3]
+    assert len(calls) == 3
+
+    # Values checked on set are not checked again on read
+    c.greedy = [4]
+    assert c.greedy == [4]
+    assert len(calls) == 4
+    with pytest.raises(TypeError):
+        c.greedy = 'a'
+    assert c.greedy == [4]
+
+
+def test_lazy_expected():
+    calls = []
+
+    def compute(obj):
+        calls.append(obj)
+        time.sleep(0.05)
+        return obj.size * 2
+
+    class Lazy(object):
+        def __init__(self, size):
+            self.size = size
+
+        double = expected.LazyExpected(factory=compute,
+                                       predicate=lambda x: x > 0,
+                                       exc_cls=ValueError)
+
+    lazy = Lazy(3)
+    values = []
+    threads = [threading.Thread(target=lambda: values.append(lazy.double)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert values == [6] * 8
+    assert len(calls) == 1
+    assert lazy.double == 6
+    assert Lazy(1).double == 2
+    assert len(calls) == 2
+
+    lazy.size = 5
+    Lazy.double.reset(lazy)
+    assert lazy.double == 10
+
+    invalid = Lazy(-1)
+    with pytest.raises(ValueError):
+        invalid.double
+    invalid.size = 1
+    assert invalid.double == 2
+
+    with pytest.raises(ValueError):
+        lazy.double = -1
+    lazy.double = 1
+    assert lazy.double == 1
+
+
+def test_lazy_expected_failures():
+    calls = []
+
+    def compute(obj):
+        calls.append(obj)
+        time.sleep(0.05)
+        raise KeyError('size')
+
+    class Lazy(object):
+        double = expected.LazyExpected(factory=compute,
+                                       predicate=lambda x: x > 0,
+                                       exc_cls=ValueError,
+                                       trigger_on_set=False)
+
+    # Threads waiting for a failing computation get its error
+    lazy = Lazy()
+    errors = []
+
+    def read():
+        try:
+            lazy.double
+        except KeyError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=read) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 5
+    assert len(calls) == 1
+
+    # Values set directly are validated when read
+    lazy.double = -3
+    with pytest.raises(ValueError):
+        lazy.double
+    lazy.double = 3
+    assert lazy.double == 3
+
+
+def test_async_lazy_expected():
+    asyncio = pytest.importorskip('asyncio')
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    calls = []
+
+    def compute(obj):
+        calls.append(obj)
+        return loop.run_in_executor(None, lambda: obj.size * 2)
+
+    class Lazy(object):
+        def __init__(self, size):
+            self.size = size
+
+        double = expected.AsyncLazyExpected(factory=compute,
+                                            predicate=lambda x: x > 0,
+                                            exc_cls=ValueError)
+
+    try:
+        lazy = Lazy(3)
+        assert loop.run_until_complete(asyncio.gather(lazy.double, lazy.double)) == [6, 6]
+        assert loop.run_until_complete(lazy.double) == 6
+        assert len(calls) == 1
+
+        lazy.size = -1
+        Lazy.double.reset(lazy)
+        with pytest.raises(ValueError):
+            loop.run_until_complete(lazy.double)
+        lazy.size = 1
+        assert loop.run_until_complete(lazy.double) == 2
+        assert len(calls) == 3
+
+        with pytest.raises(AttributeError):
+            lazy.double = 2
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def test_result_mode():
+    class NonRaising(object):
+        value = expected.Expected(predicate=lambda x: isinstance(x, str),
+                                  exc_cls=TypeError,
+                                  message='\'{value}\' is not of type \'str\'',
+                                  result=True)
+        cached = expected.Expected(predicate=lambda x: isinstance(x, str),
+                                   exc_cls=TypeError,
+                                   validate_once=True,
+                                   result=True)
+
+    a = NonRaising()
+    a.value = 'hello'
+    result = a.value
+    assert result.valid
+    assert result
+    assert result.value == 'hello'
+    assert result.unwrap() == 'hello'
+    assert result.exception() is None
+
+    a.value = 1
+    result = a.value
+    assert not result.valid
+    assert not result
+    assert result.error is TypeError
+    assert isinstance(result.exception(), TypeError)
+    assert str(result.message).startswith('\'1\' is not of type \'str\'')
+    with pytest.raises(TypeError):
+        result.unwrap()
+    with pytest.raises(AttributeError):
+        result.extra = 1
+
+    a.cached = 1
+    assert not a.cached
+    a.cached = 'hello'
+    assert a.cached.unwrap() == 'hello'
+
+
+class Config(object):
+    name = expected.Expected(predicate=lambda x: isinstance(x, str), exc_cls=TypeError)
+    size = expected.Expected(predicate=lambda x: x > 0, exc_cls=ValueError, validate_once=True)
+    label = expected.LazyExpected(factory=lambda obj: obj.name.upper(),
+                                  predicate=lambda x: len(x) < 8)
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+
+def test_validate_all():
+    assert expected.validate_all(Config('a', 1)) == {}
+
+    with pytest.raises(expected.ValidationError) as excinfo:
+        expected.validate_all(Config(1, -1))
+    errors = excinfo.value.errors
+    assert sorted(errors) == ['name', 'size']
+    assert isinstance(errors['name'], TypeError)
+    assert isinstance(errors['size'], ValueError)
+
+    # Lazy values are validated only once computed
+    config = Config('too long', 1)
+    assert expected.validate_all(config) == {}
+    with pytest.raises(RuntimeError):
+        config.label
+    assert list(expected.validate_all(Config('short', 1), raise_errors=False)) == []
+
+
+def test_validate_many():
+    configs = [Config('a', 1), Config(2, 1), Config('c', 0), Config('d', 4)]
+    errors = expected.validate_many(configs, raise_errors=False)
+    assert sorted(errors) == [1, 2]
+    assert list(errors[1]) == ['name']
+    assert list(errors[2]) == ['size']
+
+    with pytest.raises(expected.ValidationError) as excinfo:
+        expected.validate_many(configs)
+    assert sorted(excinfo.value.errors) == [1, 2]
+    assert expected.validate_many(configs[:1]) == {}
+
+
+def test_validate_raising_predicates():
+    class Counter(object):
+        count = expected.Expected(predicate=lambda x: x > 0)
+
+    counter = Counter()
+    counter.count = 'many'
+    configs = [Config('a', None), counter, Config('b', 1)]
+    # Predicates that raise are reported as failures, without stopping the batch
+    errors = expected.validate_many(configs, raise_errors=False)
+    assert sorted(errors) == [0, 1]
+    assert isinstance(errors[0]['size'], TypeError)
+    assert isinstance(errors[1]['count'], TypeError)
+
+
+def test_validate_slotted():
+    class Slotted(object):
+        __slots__ = ('_value', '_other')
+        value = expected.Expected(predicate=lambda x: x > 0, exc_cls=ValueError)
+        other = expected.Expected(predicate=lambda x: x > 0, validate_once=True)
+
+    obj = Slotted()
+    obj.value, obj.other = 1, -1
+    assert list(expected.validate_all(obj, raise_errors=False)) == ['other']
+    obj.value = -1
+    assert sorted(expected.validate_all(obj, raise_errors=False)) == ['other', 'value']
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2016 Massimiliano Culpo
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from dpp import expected
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+
+class Samples(object):
+    data = expected.ExpectedArray(predicate=[expected.finite, expected.in_range(0, 10)],
+                                  dtype=numpy.floating,
+                                  shape=(None, ),
+                                  exc_cls=ValueError)
+
+    greedy = expected.ExpectedArray(predicate=expected.finite,
+                                    shape=(2, 3),
+                                    exc_cls=ValueError,
+                                    trigger_on_set=True)
+
+
+def test_expected_array():
+    s = Samples()
+    s.data = numpy.array([0.0, 1.0, 2.0, 3.0])
+    assert (s.data == [0.0, 1.0, 2.0, 3.0]).all()
+
+    s.data = numpy.array([0.0, numpy.nan, 2.0, 11.0, numpy.inf])
+    with pytest.raises(ValueError) as excinfo:
+        s.data
+    assert '3 offending elements, e.g. at indices [1, 3, 4]' in str(excinfo.value)
+
+    s.data = numpy.array([1, 2, 3])
+    with pytest.raises(ValueError, match='dtype int'):
+        s.data
+
+    s.data = numpy.zeros((2, 2))
+    with pytest.raises(ValueError, match='shape'):
+        s.data
+
+    with pytest.raises(ValueError, match='shape'):
+        s.greedy = numpy.zeros((3, 2))
+    with pytest.raises(ValueError) as excinfo:
+        s.greedy = numpy.array([[0.0, 1.0, numpy.nan], [numpy.nan, 1.0, 2.0]])
+    assert '2 offending elements, e.g. at indices [(0, 2), (1, 0)]' in str(excinfo.value)
+
+
+def test_partial_updates():
+    s = Samples()
+    s.data = numpy.arange(10, dtype=float)
+    Samples.data.update(s, slice(2, 4), [5.0, 6.0])
+    assert s.data.tolist() == [0.0, 1.0, 5.0, 6.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0]
+
+    Samples.data.update(s, slice(6, 9), [numpy.nan, 1.0, -1.0])
+    with pytest.raises(ValueError) as excinfo:
+        s.data
+    assert '2 offending elements, e.g. at indices [6, 8]' in str(excinfo.value)
+
+    # Fixing the offending region makes the array valid again
+    Samples.data.update(s, [6, 8], 0.0)
+    assert s.data[6] == 0.0
+
+    s.greedy = numpy.zeros((2, 3))
+    with pytest.raises(ValueError) as excinfo:
+        Samples.greedy.update(s, (slice(None), 1), numpy.inf)
+    assert 'indices [(0, 1), (1, 1)]' in str(excinfo.value)
+    assert (s.greedy == 0).all()
@@ -16,6 +16,8 @@
 
 from dpp import state
 
+import pytest
+
 
 class SemaphoreLight(object):
     def __init__(self, color):
@@ -69,3 +71,167 @@ def test_semaphore():
 #    semaphore.add('blink', state.Event(current=('green', 'yellow', 'red'), next='blinking'))
 #    semaphore.add('no_blink', state.Event(current='blinking', next='yellow'))
 #    semaphore.commit()
+
+
+@state.fsm(interface=SemaphoreLight, trace=3)
+class TracedSemaphore(object):
+    green = state.State(SemaphoreLight, 'green')
+    yellow = state.State(SemaphoreLight, 'yellow')
+    red = state.State(SemaphoreLight, 'red')
+
+    slowdown = state.Event(current_state='green', next_state='yellow')
+    stop = state.Event(current_state='yellow', next_state='red')
+    prepare = state.Event(current_state='red', next_state='yellow')
+    go = state.Event(current_state='yellow', next_state='green')
+
+    __initial__ = yellow
+
+
+def test_tracer():
+    semaphore = TracedSemaphore()
+    assert len(semaphore.tracer) == 0
+    assert semaphore.tracer is not TracedSemaphore().tracer
+
+    semaphore('go')
+    semaphore('go')  # Does not fire, hence is not recorded
+    semaphore(TracedSemaphore.slowdown)
+    assert semaphore.state == SemaphoreLight('yellow')
+    records = semaphore.tracer.dump()
+    assert [record[1:] for record in records] == [('yellow', 'go', 'green'),
+                                                  ('green', 'slowdown', 'yellow')]
+    assert records[0][0] <= records[1][0]
+
+    # Overflow the ring buffer: only the last transitions are kept
+    semaphore('stop')
+    semaphore('prepare')
+    semaphore('go')
+    records = semaphore.tracer.dump()
+    assert [record[1:] for record in records] == [('yellow', 'stop', 'red'),
+                                                  ('red', 'prepare', 'yellow'),
+                                                  ('yellow', 'go', 'green')]
+
+    exported = semaphore.tracer.export()
+    assert exported['transitions'] == records
+    assert exported['counters'] == {
+        ('yellow', 'go', 'green'): 2,
+        ('green', 'slowdown', 'yellow'): 1,
+        ('yellow', 'stop', 'red'): 1,
+        ('red', 'prepare', 'yellow'): 1
+    }
+
+    semaphore.tracer.clear()
+    assert semaphore.tracer.dump() == []
+    assert semaphore.tracer.export()['counters'] == {}
+
+
+def test_tracing_is_opt_in():
+    assert not hasattr(Semaphore, 'tracer')
+    assert Semaphore.__call__ is state.FiniteStateMachineBase.__call__
+
+    with pytest.raises(TypeError):
+
+        @state.fsm(interface=SemaphoreLight, trace='yes')
+        class WrongTrace(object):
+            pass
+
+    with pytest.raises(ValueError):
+
+        @state.fsm(interface=SemaphoreLight, trace=0)
+        class EmptyTrace(object):
+            pass
+
+
+@state.fsm(method_list=['display_light'])
+class Crossing(object):
+    # Normal operation, left when the crossing is switched to maintenance
+    operating = state.SuperState(initial='red')
+    green = state.State(SemaphoreLight, 'green', parent='operating')
+    yellow = state.State(SemaphoreLight, 'yellow', parent='operating')
+    red = state.State(SemaphoreLight, 'red', parent='operating')
+    # Same as above, but the light that was on is restored when coming back
+    resumable = state.SuperState(initial='r_red', history='deep')
+    r_green = state.State(SemaphoreLight, 'green', parent='resumable')
+    r_red = state.State(SemaphoreLight, 'red', parent='resumable')
+    blinking = state.State(BlinkingLight, 'yellow')
+
+    go = state.Event(current_state='red', next_state='green')
+    stop = state.Event(current_state='green', next_state='red')
+    r_go = state.Event(current_state='r_red', next_state='r_green')
+    # Events handled by the super states are valid for each of their children
+    maintenance = state.Event(current_state='operating', next_state='blinking')
+    r_maintenance = state.Event(current_state='resumable', next_state='blinking')
+    resume = state.Event(current_state='blinking', next_state='resumable')
+    restart = state.Event(current_state='blinking', next_state='operating')
+
+    __initial__ = operating
+
+
+def test_hierarchical_states():
+    crossing = Crossing()
+    assert crossing.state is Crossing.red
+    # The hierarchy is flattened in the transition table of the leaf states
+    assert Crossing.green.next_state(Crossing.maintenance) is Crossing.blinking
+    assert Crossing.red.next_state(Crossing.maintenance) is Crossing.blinking
+    assert Crossing.blinking.next_state(Crossing.restart) is Crossing.red
+
+    crossing('go')
+    assert crossing.display_light() == 'green light on'
+    crossing('maintenance')
+    assert crossing.display_light() == 'yellow blinking'
+    crossing('restart')  # No history: enter the initial state
+    assert crossing.state is Crossing.red
+
+    crossing('maintenance')
+    crossing('resume')
+    assert crossing.state is Crossing.r_red
+    crossing('r_go')
+    crossing('r_maintenance')
+    assert crossing.state is Crossing.blinking
+    crossing('resume')  # History: enter the last active state
+    assert crossing.state is Crossing.r_green
+    assert Crossing().state is Crossing.red
+
+
+def test_shallow_history():
+    @state.fsm(method_list=['display_light'])
+    class Nested(object):
+        outer = state.SuperState(initial='first', history='shallow')
+        first = state.SuperState(initial='a', parent='outer')
+        a = state.State(SemaphoreLight, 'a', parent='first')
+        b = state.State(SemaphoreLight, 'b', parent='first')
+        second = state.State(SemaphoreLight, 'second', parent='outer')
+        off = state.State(SemaphoreLight, 'off')
+
+        next = state.Event(current_state='a', next_state='b')
+        switch = state.Event(current_state='first', next_state='second')
+        leave = state.Event(current_state='outer', next_state='off')
+        back = state.Event(current_state='off', next_state='outer')
+
+        __initial__ = off
+
+    nested = Nested()
+    nested('back')
+    assert nested.state is Nested.a
+    nested('next')
+    nested('leave')
+    nested('back')  # Shallow history re-enters 'first' from its initial state
+    assert nested.state is Nested.a
+    nested('switch')
+    nested('leave')
+    nested('back')
+    assert nested.state is Nested.second
+
+
+def test_wrong_hierarchy():
+    with pytest.raises(ValueError):
+        state.SuperState(initial='a', history='always')
+
+    with pytest.raises(ValueError):
+
+        @state.fsm(method_list=['display_light'])
+        class WrongInitial(object):
+            group = state.SuperState(initial='a')
+            a = state.State(SemaphoreLight, 'a')
+            enter = state.Event(current_state='a', next_state='group')
+
+            __initial__ = a